@@ -1,108 +1,377 @@
 import os
+import atexit
+# The thread budget has to be set before numpy, torch and TensorFlow create their pools
+import thread_budget
+THREAD_BUDGET = thread_budget.apply()
 import numpy as np
-import pickle
 import time
-import librosa
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-import whisper
-from keras.models import load_model
-from keras.preprocessing.sequence import pad_sequences
-import io
-import wave
+import pipeline
+import audio_codec
+from mel_stream import MelSessions
+from memstats import memory_usage
+from pipeline import SAMPLE_RATE
 
 app = Flask(__name__)
 CORS(app)  # Enable cross-origin requests from mobile apps
 
 #CONFIGURATION
-MAX_LENGTH = 100 
-# Balanced threshold to reduce false positives but still catch obvious scams
-SCAM_THRESHOLD = 0.7 
 CHUNK_DURATION = 5  # Process every 5 seconds of audio
+# Progressive /predict: transcribe the file front to back in segments and
+# stop early once a scam verdict reaches this confidence (None = never stop)
+PROGRESSIVE_SEGMENT_SECONDS = 10
+EARLY_STOP_CONFIDENCE = 90.0
+# Whisper worker processes fed through shared memory (0 = transcribe in the request thread)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', THREAD_BUDGET.get('inference_workers') or 0))
+INFERENCE_SLOTS = int(os.environ.get('INFERENCE_SLOTS', 8))
+# Hot reload: every N seconds, load the version train_model.py last finished (0 = only via POST /admin/reload)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
+# Set by serve_prefork.py: several worker processes serve this app
+PREFORK = os.environ.get('SERVE_PREFORK') == '1'
+# How often pre-forked workers check for a reload requested in another worker
+PREFORK_RELOAD_POLL = 2
+# Admin endpoints need this token in X-Admin-Token; without it they are localhost-only
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# SQLite file for server-side history and statistics ('' disables storing results)
+RESULT_STORE_PATH = os.environ.get('RESULT_STORE', 'scam_results.db')
+# Transcripts can contain OTPs and passwords: only verdicts are stored unless enabled
+STORE_TRANSCRIPTS = os.environ.get('STORE_TRANSCRIPTS', '').lower() in ('1', 'true', 'yes')
+# Opt-in profiling (see profiling.py); nothing is hooked in when disabled
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# /stream with a session_id decodes the newest STREAM_WINDOW_SECONDS of the call
+# from a per-session buffer of log-mel frames (see mel_stream.py)
+STREAM_WINDOW_SECONDS = int(os.environ.get('STREAM_WINDOW_SECONDS', 30))
+STREAM_SESSION_TTL = int(os.environ.get('STREAM_SESSION_TTL', 300))
+# /stream chunks from concurrent calls are decoded together: up to STT_BATCH_SIZE
+# chunks arriving within STT_BATCH_WAIT_MS share one Whisper pass (0 = off)
+STT_BATCH_SIZE = int(os.environ.get('STT_BATCH_SIZE', 0))
+STT_BATCH_WAIT_MS = float(os.environ.get('STT_BATCH_WAIT_MS', 20))
+# Load-aware quality tiers (see quality.py): /predict, /stream and /detect step down
+# to cheaper models when the p95 of a /stream chunk (or of a stage, e.g. queue wait)
+# exceeds its share of this many ms (0 = always full quality)
+QUALITY_SLO_MS = float(os.environ.get('QUALITY_SLO_MS', 0))
+QUALITY_ENDPOINTS = ('/predict', '/stream', '/detect')
+# Requests timed whole against the SLO: a /predict upload takes as long as its recording
+QUALITY_TIMED_ENDPOINTS = ('/stream',)
+# Requests on those endpoints running at once (thread_budget.py; 0 = unlimited)
+MAX_CONCURRENT_REQUESTS = THREAD_BUDGET.get('max_concurrent_requests') or 0
+# Text-only profile: no Whisper/torch, audio endpoints answer 503. With
+# SCAM_DETECTOR=numpy or student TensorFlow is not imported either
+TEXT_ONLY = os.environ.get('TEXT_ONLY', '').lower() in ('1', 'true', 'yes')
 
 #1. LOAD MODELS
-print("Loading Whisper Model (this might take a minute)...")
-stt_model = whisper.load_model("base") 
+if TEXT_ONLY:
+    print("Text-only profile: Whisper not loaded, audio endpoints disabled")
+else:
+    print("Loading Whisper Model (this might take a minute)...")
+    pipeline.load_stt_model()
 
-print("Loading Scam Detection Model (CNN-LSTM)...")
+print(f"Loading Scam Detection Model ({pipeline.SCAM_DETECTOR})...")
 try:
-    scam_model = load_model('scam_detector_model.h5')
-    with open('tokenizer.pickle', 'rb') as handle:
-        tokenizer = pickle.load(handle)
+    pipeline.load_text_model()
     print("All Models Loaded Successfully!")
 except Exception as e:
     print(f"Error loading CNN-LSTM model: {e}")
     print("Run 'python train_model.py' first to create the AI brain.")
     exit()
 
-# Helper function for scam detection
-def detect_scam(text_transcript):
-    """Analyzes text and returns scam prediction"""
-    if not text_transcript or len(text_transcript.strip()) == 0:
-        return None, None
-
-    cleaned_text = text_transcript.lower()
-    keyword_hits = [
-        kw for kw in [
-            "transfer", "bank", "account", "pending transaction", "pay now", "click", "link",
-            "otp", "password", "verification", "refund", "fine", "legal", "warrant",
-            "immediately", "urgent", "your money", "send money", "wire",
-            "social security", "suspend", "irs", "tax debt", "rebate check", "overcharge",
-            "lawsuit settlement", "approval", "settlement", "suspicious activity",
-        ]
-        if kw in cleaned_text
-    ]
-
-    # If strong scam keywords appear, force scam with high confidence
-    if keyword_hits:
-        return True, 95.0
+quality = None
+if QUALITY_SLO_MS > 0:
+    from quality import QualityController
+    print(f"Loading fast models for degraded quality tiers (SLO {QUALITY_SLO_MS:.0f} ms)...")
+    pipeline.load_fast_models()
+    quality = QualityController(QUALITY_SLO_MS)
+
+request_limiter = None
+if MAX_CONCURRENT_REQUESTS > 0:
+    request_limiter = thread_budget.RequestLimiter(MAX_CONCURRENT_REQUESTS)
+
+stream_sessions = MelSessions(STREAM_WINDOW_SECONDS, STREAM_SESSION_TTL)
+
+stt_batcher = None
+if STT_BATCH_SIZE > 0 and not TEXT_ONLY:
+    from stt_batcher import BatchedTranscriber
+    stt_batcher = BatchedTranscriber(pipeline.stt_model, STT_BATCH_SIZE, STT_BATCH_WAIT_MS / 1000)
+    print(f"Batched /stream transcription: up to {STT_BATCH_SIZE} chunks per {STT_BATCH_WAIT_MS:.0f} ms")
+
+inference_pool = None
+if INFERENCE_WORKERS > 0 and not TEXT_ONLY:
+    from inference_pool import InferencePool
+    inference_pool = InferencePool(workers=INFERENCE_WORKERS, slots=INFERENCE_SLOTS)
+    atexit.register(inference_pool.close)
+    # serve_prefork.py's parent owns the pool and supervises it from its own loop
+    if not PREFORK:
+        inference_pool.start_supervisor()
+
+model_watcher = None
+if MODEL_WATCH_INTERVAL > 0:
+    model_watcher = pipeline.ModelWatcher(MODEL_WATCH_INTERVAL)
+elif PREFORK:
+    # Only follows /admin/reload from the other workers
+    model_watcher = pipeline.ModelWatcher(PREFORK_RELOAD_POLL, watch_files=False)
+if model_watcher is not None and not PREFORK:
+    # Pre-forked workers start their own on their first request; the parent must not run TensorFlow
+    model_watcher.ensure_running()
+
+result_store = None
+call_verdicts = None
+if RESULT_STORE_PATH:
+    from result_store import ResultStore, CallVerdicts
+    result_store = ResultStore(RESULT_STORE_PATH)
+    call_verdicts = CallVerdicts(STREAM_SESSION_TTL)
+    atexit.register(result_store.flush)
+
+def _transcribe(audio_data, tier='full', **options):
+    """Transcribes in the inference pool when enabled and the audio fits a slot"""
+    if tier != 'full':
+        # Degraded tiers: one greedy pass, no temperature fallback or prompt conditioning
+        options.update(temperature=0.0, condition_on_previous_text=False)
+        if tier in ('fast', 'keywords') and pipeline.fast_stt_model is not None:
+            return pipeline.transcribe(audio_data, model=pipeline.fast_stt_model, **options)
+    if inference_pool is not None and inference_pool.fits(audio_data):
+        options.setdefault('language', 'en')
+        return inference_pool.transcribe(audio_data, timings=_queue_timings(), **options)
+    return pipeline.transcribe(audio_data, **options)
+
+def _text_model():
+    """The model version this request started with; a reload mid-request does not change it"""
+    if 'text_model' not in g:
+        g.text_model = pipeline.active_text_model
+    return g.text_model
+
+def _analyze(text_transcript, tier='full'):
+    """Scores a transcript with the model the quality tier allows"""
+    if tier == 'keywords':
+        return pipeline.analyze_keywords([text_transcript])[0]
+    if tier == 'fast' and pipeline.fast_text_model is not None:
+        return pipeline.analyze_texts([text_transcript], pipeline.fast_text_model)[0]
+    return pipeline.analyze_text(text_transcript, _text_model())
+
+@app.before_request
+def _pin_text_model():
+    _text_model()
+    if model_watcher is not None:
+        model_watcher.ensure_running()
+
+def _quality_tier():
+    """Tier chosen for this request when it started ('full' without a controller)"""
+    return g.get('quality_tier', 'full')
+
+def _observe_stage(stage, started):
+    if quality is not None:
+        quality.observe_stage(stage, time.perf_counter() - started)
+
+def _queue_timings():
+    """Per-request dict the limiter, STT batcher and inference pool add their wait to"""
+    if 'queue_timings' not in g:
+        g.queue_timings = {"queue_seconds": 0.0}
+    return g.queue_timings
+
+@app.before_request
+def _quality_start():
+    if quality is not None and request.path in QUALITY_ENDPOINTS:
+        g.quality_tier = quality.tier()
+        g.quality_started = time.perf_counter()
+        quality.started()
+
+@app.teardown_request
+def _quality_finish(exc):
+    # Runs after a streamed (progressive) response has finished, so it covers the whole request
+    if quality is not None and 'quality_started' in g:
+        seconds = time.perf_counter() - g.pop('quality_started')
+        quality.observe_stage('queue', _queue_timings()["queue_seconds"])
+        quality.finished(g.quality_tier, seconds if request.path in QUALITY_TIMED_ENDPOINTS else None)
+
+@app.before_request
+def _limit_start():
+    # After _quality_start, so time spent queueing counts towards the quality p95
+    if request_limiter is not None and request.path in QUALITY_ENDPOINTS:
+        queued = time.perf_counter()
+        acquired = request_limiter.acquire()
+        _queue_timings()["queue_seconds"] += time.perf_counter() - queued
+        if not acquired:
+            return jsonify({'error': 'Server busy, try again shortly'}), 503
+        g.limiter_slot = True
+
+@app.teardown_request
+def _limit_finish(exc):
+    if request_limiter is not None and g.pop('limiter_slot', False):
+        request_limiter.release()
+
+def _audio_disabled():
+    """503 response for audio endpoints in the text-only profile"""
+    return jsonify({'error': 'Audio endpoints are disabled (TEXT_ONLY profile); use /detect'}), 503
+
+def _client_addr():
+    """Caller address; behind router.py (a loopback peer) the one it put in X-Forwarded-For"""
+    if request.remote_addr in ('127.0.0.1', '::1') and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[-1].strip()
+    return request.remote_addr
+
+def _user_id(data=None):
+    """Caller id for the result store: X-User-Id header, or user_id in the body"""
+    user_id = request.headers.get('X-User-Id')
+    if not user_id and data:
+        user_id = data.get('user_id')
+    return user_id or request.form.get('user_id') or 'anonymous'
+
+def _record(user_id, endpoint, verdict, transcript):
+    """Queues a verdict for the result store (no-op when disabled)"""
+    if result_store is not None:
+        result_store.record(user_id, endpoint, verdict["is_scam"], verdict["confidence"],
+                            verdict["model_version"], transcript if STORE_TRANSCRIPTS else None)
+
+def _form_flag(name, default=False):
+    """Reads a boolean flag from the form body or the query string"""
+    value = request.form.get(name, request.args.get(name))
+    if value is None:
+        return default
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def _early_stop_confidence():
+    """Returns the early-exit confidence for this request (None disables early exit)"""
+    if not _form_flag('early_stop', default=True):
+        return None
+    value = request.form.get('stop_confidence', request.args.get('stop_confidence'))
+    if value is None:
+        return EARLY_STOP_CONFIDENCE
+    value = float(value)
+    if not 0 <= value <= 100:
+        raise ValueError(value)
+    return value
+
+def progressive_analysis(audio_data, amplitude, stop_confidence, user_id, tier='full'):
+    """Transcribes audio front to back and yields a verdict after every segment"""
+    segment_samples = int(PROGRESSIVE_SEGMENT_SECONDS * SAMPLE_RATE)
+    total_seconds = round(len(audio_data) / SAMPLE_RATE, 2)
+    started = time.time()
+    transcript = ""
+    verdict = {"is_scam": None, "confidence": None, "model_version": pipeline.active_text_model.version,
+               "window": None}
+    early_exit = False
+    processed_samples = 0
+    
+    for segment_index, offset in enumerate(range(0, len(audio_data), segment_samples)):
+        segment = audio_data[offset:offset + segment_samples]
+        processed_samples = offset + len(segment)
+        try:
+            # Carry the tail of the transcript so far as context for the next segment
+            segment_text = _transcribe(segment, tier, initial_prompt=transcript[-200:] or None)
+        except Exception as whisper_err:
+            print(f"[PREDICT] Whisper error on segment {segment_index}: {whisper_err}")
+            yield {"event": "error", "error": f"Transcription failed: {str(whisper_err)}"}
+            return
+        
+        if segment_text:
+            transcript = f"{transcript} {segment_text}".strip()
+            try:
+                verdict = _analyze(transcript, tier)
+            except Exception as model_err:
+                print(f"[PREDICT] Scoring error on segment {segment_index}: {model_err}")
+                yield {"event": "error", "error": f"Scoring failed: {str(model_err)}"}
+                return
+        
+        print(f"[PREDICT] Segment {segment_index}: '{segment_text}' -> Scam: {verdict['is_scam']}, Confidence: {verdict['confidence']}%")
+        yield {
+            "event": "partial",
+            "segment_index": segment_index,
+            "segment_start": round(offset / SAMPLE_RATE, 2),
+            "segment_end": round(processed_samples / SAMPLE_RATE, 2),
+            "segment_text": segment_text,
+            "transcript": transcript,
+            "is_scam": verdict["is_scam"],
+            "confidence": verdict["confidence"],
+            "model_version": verdict["model_version"],
+            "window": verdict["window"],
+            "quality_tier": tier,
+            "elapsed": round(time.time() - started, 3)
+        }
+        
+        if (stop_confidence is not None and verdict["is_scam"] and verdict["confidence"] >= stop_confidence
+                and processed_samples < len(audio_data)):
+            early_exit = True
+            print(f"[PREDICT] Early exit after {processed_samples / SAMPLE_RATE:.1f}s of {total_seconds}s")
+            break
     
-    sequences = tokenizer.texts_to_sequences([text_transcript])
-    padded = pad_sequences(sequences, maxlen=MAX_LENGTH, padding='post', truncating='post')
-    prediction = scam_model.predict(padded, verbose=0)[0][0]
+    # Same placeholder rule as the full-file path for synthetic test audio
+    if not transcript and 0.01 < amplitude < 0.50:
+        print(f"[PREDICT] No speech detected but audio has content (test audio). Using placeholder.")
+        transcript = "[Test Audio - No Speech Detected]"
+        try:
+            verdict = _analyze(transcript, tier)
+        except Exception as model_err:
+            print(f"[PREDICT] Scoring error: {model_err}")
+            yield {"event": "error", "error": f"Scoring failed: {str(model_err)}"}
+            return
     
-    is_scam = bool(prediction > SCAM_THRESHOLD)
-    confidence_score = round(float(prediction) * 100, 2)
+    if not transcript:
+        yield {"event": "error", "error": "Could not hear any voice."}
+        return
     
-    if not is_scam:
-        confidence_score = round((1 - float(prediction)) * 100, 2)
+    _record(user_id, 'predict', verdict, transcript)
+    yield {
+        "event": "final",
+        "transcript": transcript,
+        "is_scam": verdict["is_scam"],
+        "confidence": verdict["confidence"],
+        "model_version": verdict["model_version"],
+        "window": verdict["window"],
+        "quality_tier": tier,
+        "early_exit": early_exit,
+        "audio_seconds_processed": round(processed_samples / SAMPLE_RATE, 2),
+        "audio_seconds_total": total_seconds,
+        "elapsed": round(time.time() - started, 3)
+    }
+
+def _stream_events(events, use_sse):
+    """Wraps an event generator as NDJSON or server-sent events"""
+    def generate():
+        for event in events:
+            if use_sse:
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield json.dumps(event) + "\n"
     
-    return is_scam, confidence_score
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop reverse proxies buffering partial results
+    return response
 
 # ============ ENDPOINT 1: FULL AUDIO FILE (Original) ============
 @app.route('/predict', methods=['POST'])
 def predict():
-    """Process complete audio file for scam detection"""
+    """Process complete audio file for scam detection
+    
+    Send progressive=true to receive partial verdicts as NDJSON (or SSE with
+    format=sse / Accept: text/event-stream) while the file is transcribed.
+    """
+    if TEXT_ONLY:
+        return _audio_disabled()
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
     file = request.files['file']
-    filename = None
     
     try:
-        # Save with original extension
-        original_filename = file.filename or "temp_audio"
-        file_extension = os.path.splitext(original_filename)[1] or '.wav'
-        filename = f"temp_audio_{os.getpid()}_{int(time.time()*1000)}{file_extension}"
-        
-        file.save(filename)
-        
-        # Verify file was saved and has content
-        if not os.path.exists(filename):
-            return jsonify({'error': 'Failed to save audio file'}), 500
-        
-        file_size = os.path.getsize(filename)
-        print(f"[PREDICT] Processing file: {filename} (size: {file_size} bytes)")
+        data = file.read()
+        file_size = len(data)
+        print(f"[PREDICT] Processing upload: {file.filename} (size: {file_size} bytes)")
         
         if file_size < 100:
             return jsonify({'error': f'Audio file too small ({file_size} bytes). Check microphone.'}), 400
         
-        # Load audio using librosa (supports m4a, wav, mp3, etc)
-        print(f"[PREDICT] Loading audio with librosa...")
+        # WAV/FLAC/Opus decode in memory; other formats (m4a, mp3, ...) go through librosa
         try:
-            # Librosa auto-detects format and loads at specified sr
-            audio_data, sr = librosa.load(filename, sr=16000)
-            print(f"[PREDICT] Audio loaded: {len(audio_data)} samples at {sr}Hz, amplitude: min={audio_data.min():.4f}, max={audio_data.max():.4f}")
+            decode_started = time.perf_counter()
+            audio_data, codec = audio_codec.decode_upload(data, file.filename)
+            if len(audio_data) == 0:
+                return jsonify({'error': 'Audio file contains no samples'}), 400
+            print(f"[PREDICT] Audio decoded ({codec}, {(time.perf_counter() - decode_started) * 1000:.1f} ms): {len(audio_data)} samples at {SAMPLE_RATE}Hz, amplitude: min={audio_data.min():.4f}, max={audio_data.max():.4f}")
             
             # Check if audio is not silent
             amplitude = np.max(np.abs(audio_data))
@@ -110,20 +379,30 @@ def predict():
                 print(f"[PREDICT] Audio too quiet (amplitude={amplitude:.4f})")
                 return jsonify({'error': f'Audio is too quiet or silent (amplitude={amplitude:.4f}). Please speak louder.'}), 400
         except Exception as load_err:
-            print(f"[PREDICT] Librosa load error: {load_err}")
+            print(f"[PREDICT] Audio decode error: {load_err}")
             return jsonify({'error': f'Failed to load audio: {str(load_err)}'}), 400
         
+        # Progressive mode: stream partial verdicts instead of waiting for the whole file
+        if _form_flag('progressive'):
+            try:
+                stop_confidence = _early_stop_confidence()
+            except ValueError:
+                return jsonify({'error': 'stop_confidence must be a number between 0 and 100'}), 400
+            use_sse = (request.form.get('format', request.args.get('format', '')).lower() == 'sse'
+                       or 'text/event-stream' in request.headers.get('Accept', ''))
+            print(f"[PREDICT] Progressive mode (stop at {stop_confidence}%, {'SSE' if use_sse else 'NDJSON'})")
+            events = progressive_analysis(audio_data, amplitude, stop_confidence, _user_id(), _quality_tier())
+            return _stream_events(events, use_sse)
+        
         # Transcribe using Whisper with numpy array
         print(f"[PREDICT] Transcribing with Whisper...")
         try:
             # Whisper expects float32 in [-1, 1] range - librosa gives us that
-            result = stt_model.transcribe(audio_data, language='en')
+            text_transcript = _transcribe(audio_data, _quality_tier())
         except Exception as whisper_err:
             print(f"[PREDICT] Whisper error: {whisper_err}")
             return jsonify({'error': f'Transcription failed: {str(whisper_err)}'}), 400
         
-        text_transcript = result.get("text", "").strip()
-        
         print(f"[PREDICT] Transcript: {text_transcript}")
         
         # For testing: if amplitude is in range but no transcript, use placeholder
@@ -135,14 +414,18 @@ def predict():
         if not text_transcript:
             return jsonify({'error': "Could not hear any voice."}), 400
         
-        is_scam, confidence_score = detect_scam(text_transcript)
+        verdict = _analyze(text_transcript, _quality_tier())
+        _record(_user_id(), 'predict', verdict, text_transcript)
         
-        print(f"[PREDICT] Scam: {is_scam}, Confidence: {confidence_score}%")
+        print(f"[PREDICT] Scam: {verdict['is_scam']}, Confidence: {verdict['confidence']}%")
 
         return jsonify({
             "transcript": text_transcript,
-            "is_scam": is_scam,
-            "confidence": confidence_score
+            "is_scam": verdict["is_scam"],
+            "confidence": verdict["confidence"],
+            "model_version": verdict["model_version"],
+            "window": verdict["window"],
+            "quality_tier": _quality_tier()
         })
         
     except Exception as e:
@@ -150,52 +433,89 @@ def predict():
         import traceback
         traceback.print_exc()
         return jsonify({'error': f"Processing failed: {str(e)}"}), 500
-    finally:
-        # Always clean up temp file
-        if filename and os.path.exists(filename):
-            try:
-                os.remove(filename)
-                print(f"[PREDICT] Cleaned up: {filename}")
-            except Exception as cleanup_err:
-                print(f"[PREDICT] Cleanup error: {cleanup_err}")
 
 
 # ============ ENDPOINT 2: REAL-TIME AUDIO STREAMING ============
 @app.route('/stream', methods=['POST'])
 def stream_predict():
-    """Process audio chunks in real-time (for mobile apps)"""
+    """Process audio chunks in real-time (for mobile apps); WAV, FLAC or Opus
+    
+    With a session_id (X-Session-Id header, query string or form field), each chunk extends the call's log-mel buffer and the
+    transcript covers the newest STREAM_WINDOW_SECONDS of the call, not just
+    this chunk.
+    """
+    if TEXT_ONLY:
+        return _audio_disabled()
     if 'chunk' not in request.files:
         return jsonify({'error': 'No audio chunk provided'}), 400
     
     chunk_file = request.files['chunk']
     chunk_index = request.form.get('chunk_index', 0)
     is_final = request.form.get('is_final', 'false').lower() == 'true'
+    # Same sources, in the same order, as router.py uses to place the session
+    session_id = (request.headers.get('X-Session-Id') or request.args.get('session_id')
+                  or request.form.get('session_id'))
+    if session_id and PREFORK:
+        # Sessions live in one process; pre-forked workers share the socket, so a
+        # call's chunks would be spread over several partial mel buffers
+        return jsonify({'error': 'session_id streaming needs one process per port '
+                                 '(run app.py replicas behind router.py, not serve_prefork.py)'}), 400
     
     try:
-        # Save chunk temporarily
-        chunk_filename = f"temp_chunk_{chunk_index}.wav"
-        chunk_file.save(chunk_filename)
-        
-        # Transcribe this chunk
-        result = stt_model.transcribe(chunk_filename)
-        text_transcript = result["text"].strip()
+        # Decode once here (in memory for WAV/FLAC/Opus); with the inference
+        # pool only the PCM crosses processes
+        audio_data, codec = audio_codec.decode_upload(chunk_file.read(), chunk_file.filename)
+        tier = _quality_tier()
+        # Cheap tiers with a small Whisper loaded skip the batcher (it decodes with the full model)
+        fast_stt = tier in ('fast', 'keywords') and pipeline.fast_stt_model is not None
+        stt_started = time.perf_counter()
+        if session_id:
+            stream = stream_sessions.get(session_id, pipeline.stt_model.dims.n_mels)
+            with stream.lock:
+                stream.append(audio_data)
+                if fast_stt:
+                    text_transcript = stream.decode(pipeline.fast_stt_model, language=None)
+                elif stt_batcher is not None:
+                    text_transcript = stt_batcher.transcribe_mel(stream.model_input(), language=None,
+                                                                 timings=_queue_timings())
+                else:
+                    text_transcript = stream.decode(pipeline.stt_model, language=None)
+            if is_final:
+                stream_sessions.end(session_id)
+        elif stt_batcher is not None and not fast_stt and stt_batcher.fits(audio_data):
+            text_transcript = stt_batcher.transcribe(audio_data, language=None, timings=_queue_timings())
+        else:
+            text_transcript = _transcribe(audio_data, tier, language=None)
+        _observe_stage('stt', stt_started)
         
         # Detect scam on current chunk
-        is_scam = None
-        confidence_score = None
+        scoring_started = time.perf_counter()
+        verdict = _analyze(text_transcript, tier)
+        _observe_stage('scoring', scoring_started)
+        # A call is stored once, with its worst chunk, so stats count calls rather than chunks
+        if call_verdicts is not None:
+            call_key = (session_id or request.form.get('call_id')
+                        or f"{_user_id()}@{_client_addr()}")
+            ended = call_verdicts.add(call_key, _user_id(), verdict, text_transcript,
+                                      new_call=str(chunk_index) == '0' and not session_id)
+            if is_final:
+                ended.append(call_verdicts.finish(call_key))
+            for call in filter(None, ended):
+                call_user, call_verdict, call_transcript = call
+                _record(call_user, 'stream', call_verdict, call_transcript)
         
         if text_transcript:
-            is_scam, confidence_score = detect_scam(text_transcript)
-            print(f"[STREAM] Chunk {chunk_index}: '{text_transcript}' -> Scam: {is_scam}")
-        
-        # Clean up
-        os.remove(chunk_filename)
+            print(f"[STREAM] Chunk {chunk_index} ({codec}): '{text_transcript}' -> Scam: {verdict['is_scam']}")
         
         return jsonify({
             "chunk_index": chunk_index,
             "transcription": text_transcript,
-            "is_scam": is_scam,
-            "confidence": confidence_score,
+            "is_scam": verdict["is_scam"],
+            "confidence": verdict["confidence"],
+            "model_version": verdict["model_version"],
+            "window": verdict["window"],
+            "quality_tier": tier,
+            "session_id": session_id,
             "is_final": is_final
         })
         
@@ -218,14 +538,20 @@ def text_detect():
         return jsonify({'error': "Text cannot be empty"}), 400
     
     try:
-        is_scam, confidence_score = detect_scam(text_transcript)
+        scoring_started = time.perf_counter()
+        verdict = _analyze(text_transcript, _quality_tier())
+        _observe_stage('scoring', scoring_started)
+        _record(_user_id(data), 'detect', verdict, text_transcript)
         
-        print(f"[TEXT] Input: '{text_transcript}' -> Scam: {is_scam}")
+        print(f"[TEXT] Input: '{text_transcript}' -> Scam: {verdict['is_scam']}")
         
         return jsonify({
             "text": text_transcript,
-            "is_scam": is_scam,
-            "confidence": confidence_score
+            "is_scam": verdict["is_scam"],
+            "confidence": verdict["confidence"],
+            "model_version": verdict["model_version"],
+            "window": verdict["window"],
+            "quality_tier": _quality_tier()
         })
         
     except Exception as e:
@@ -239,21 +565,184 @@ def health():
     return jsonify({
         "status": "healthy",
         "models_loaded": True,
-        "message": "Scam Detection API is running"
+        "message": "Scam Detection API is running",
+        "model_version": pipeline.active_text_model.version,
+        "detector": pipeline.SCAM_DETECTOR,
+        "scam_threshold": pipeline.SCAM_THRESHOLD,
+        "config_version": pipeline.config.get("version") if pipeline.config else None,
+        "text_only": TEXT_ONLY,
+        "inference_pool": inference_pool.stats() if inference_pool else None,
+        "stream_sessions": stream_sessions.stats(),
+        "stt_batcher": stt_batcher.stats() if stt_batcher else None,
+        "quality": quality.stats() if quality else None,
+        "thread_budget": thread_budget.stats(),
+        "request_limiter": request_limiter.stats() if request_limiter else None
+    })
+
+# ============ ENDPOINT 5: MEMORY USAGE ============
+@app.route('/memory', methods=['GET'])
+def memory():
+    """Report RSS/PSS of the worker process that served this request"""
+    return jsonify(memory_usage())
+
+# ============ ENDPOINT 6: METRICS ============
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-codec upload size and decode time"""
+    return jsonify({"codecs": audio_codec.codec_stats()})
+
+# ============ ENDPOINT 7: RESULT HISTORY ============
+@app.route('/history', methods=['GET'])
+def history():
+    """Stored verdicts, newest first (user_id, is_scam, limit, before= for paging)
+    
+    X-User-Id is not authenticated, so callers only get one user's verdicts;
+    all users and the stored transcripts need admin access.
+    """
+    if result_store is None:
+        return jsonify({'error': 'Result store is disabled'}), 503
+    user_id = request.args.get('user_id')
+    admin = _admin_allowed()
+    if user_id is None and not admin:
+        return jsonify({'error': 'user_id is required'}), 403
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        before = request.args.get('before')
+        before = float(before) if before is not None else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be numbers'}), 400
+    is_scam = request.args.get('is_scam')
+    if is_scam is not None:
+        is_scam = is_scam.lower() in ('1', 'true', 'yes')
+    
+    started = time.time()
+    results = result_store.history(user_id, limit, before, is_scam)
+    if not admin:
+        for result in results:
+            result.pop("transcript", None)
+    return jsonify({
+        "results": results,
+        "next_before": results[-1]["created_at"] if len(results) == limit else None,
+        "query_ms": round((time.time() - started) * 1000, 2)
+    })
+
+# ============ ENDPOINT 8: STATISTICS ============
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Precomputed counts, daily scam rate and confidence histogram (user_id, days)"""
+    if result_store is None:
+        return jsonify({'error': 'Result store is disabled'}), 503
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 3650)
+    except ValueError:
+        return jsonify({'error': 'days must be a number'}), 400
+    
+    started = time.time()
+    summary = result_store.stats(request.args.get('user_id'), days)
+    summary["query_ms"] = round((time.time() - started) * 1000, 2)
+    return jsonify(summary)
+
+# ============ ADMIN: MODEL HOT RELOAD ============
+def _admin_allowed():
+    """Admin endpoints need the admin token, or a local caller when none is set
+
+    A proxied request (router.py always sets X-Forwarded-For) comes from
+    127.0.0.1 but not from a local user, so it never gets the local fallback.
+    """
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+    """List the serving model version and the versions available to load"""
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        "active": pipeline.active_text_model.version,
+        "available": pipeline.list_model_versions()
+    })
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Load, warm up and swap in a model version (default: the top-level model files)"""
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if version is not None and version not in pipeline.list_model_versions():
+        return jsonify({'error': f"Unknown model version '{version}'"}), 404
+    
+    try:
+        # Pre-forked: the other workers pick the same version up from the reload marker
+        new_version, previous_version, seconds = pipeline.reload_text_model(version, broadcast=PREFORK)
+    except Exception as e:
+        print(f"[ADMIN] Reload failed: {e}")
+        return jsonify({'error': f"Reload failed, still serving {pipeline.active_text_model.version}: {str(e)}"}), 500
+    
+    print(f"[ADMIN] Model {previous_version} -> {new_version} ({seconds}s load + warm-up)")
+    return jsonify({
+        "model_version": new_version,
+        "previous_version": previous_version,
+        "load_seconds": seconds
     })
 
+# ============ ADMIN: STREAM SESSION HANDOFF ============
+# Used by router.py to move live calls between replicas when one joins or drains
+@app.route('/admin/sessions', methods=['GET'])
+def admin_sessions():
+    """List the stream sessions held by this replica"""
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({"sessions": stream_sessions.ids()})
+
+@app.route('/admin/sessions/<session_id>', methods=['GET', 'PUT'])
+def admin_session_state(session_id):
+    """GET removes the session and returns its state; PUT installs a state exported elsewhere"""
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'PUT':
+        try:
+            stream_sessions.restore(session_id, request.get_data())
+        except Exception as e:
+            return jsonify({'error': f"Invalid session state: {str(e)}"}), 400
+        print(f"[SESSIONS] Imported session {session_id}")
+        return jsonify({"session_id": session_id, "imported": True})
+    
+    state = stream_sessions.export(session_id)
+    if state is None:
+        return jsonify({'error': f"Unknown session '{session_id}'"}), 404
+    print(f"[SESSIONS] Exported session {session_id} ({len(state)} bytes)")
+    return Response(state, mimetype='application/octet-stream')
+
+# ============ ADMIN: PROFILING (opt-in) ============
+if PROFILING_ENABLED:
+    import profiling
+    profiling.install(app, _admin_allowed, PROFILE_DIR, PROFILE_SAMPLE_RATE,
+                      inference_pool.sample if inference_pool is not None else None)
+
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Scam Detection API")
+    parser.add_argument('--port', type=int, default=5000, help="Run several replicas behind router.py on different ports")
+    args = parser.parse_args()
+    
     print("\n" + "="*60)
     print("SCAM DETECTION API STARTED")
     print("="*60)
     print("Available Endpoints:")
-    print("  1. POST /predict     - Full audio file analysis")
+    print("  1. POST /predict     - Full audio file analysis (progressive=true streams partial verdicts)")
     print("  2. POST /stream      - Real-time audio streaming")
     print("  3. POST /detect      - Text-only detection")
     print("  4. GET  /health      - API health check")
+    print("  5. GET  /memory      - Worker memory usage (RSS/PSS)")
+    print("  6. GET  /metrics     - Upload codec sizes and decode times")
+    print("  7. GET  /history     - Stored results (server-side call history)")
+    print("  8. GET  /stats       - Aggregated statistics")
+    print("  9. POST /admin/reload - Swap in a retrained model without restarting")
     print("="*60)
-    print("Running on: http://0.0.0.0:5000")
+    print(f"Running on: http://0.0.0.0:{args.port}")
     print("="*60 + "\n")
     
     # Host='0.0.0.0' allows mobile phone to connect
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=args.port, debug=True)
\ No newline at end of file
@@ -7,6 +7,7 @@ import tempfile
 import librosa
 import pickle
 import numpy as np
+from pipeline import load_config
 
 # Try to import TensorFlow/Keras
 try:
@@ -33,6 +34,14 @@ CORS(app)
 MAX_LENGTH = 100
 SCAM_THRESHOLD = 0.5
 VOCAB_SIZE = 5000
+# The keyword fallback keeps 0.5; the trained model uses sweep.py's calibrated threshold if present
+KEYWORD_THRESHOLD = SCAM_THRESHOLD
+scam_config = load_config()
+if scam_config is not None and scam_config.get('scam_threshold') is not None:
+    SCAM_THRESHOLD = float(scam_config['scam_threshold'])
+    print(f"✓ Calibrated threshold {SCAM_THRESHOLD:.4f} (scam_config.json version {scam_config.get('version')})")
+# 'cnn-lstm' (default) or 'student': the distilled NumPy model saved by train_model.py
+SCAM_DETECTOR = os.environ.get('SCAM_DETECTOR', 'cnn-lstm')
 
 # Load Whisper model
 print("Loading OpenAI Whisper Model...")
@@ -64,6 +73,17 @@ if HAS_KERAS:
 else:
     print("✗ Keras not available - will use keyword-based detection only")
 
+# Optional distilled student model (no TensorFlow or tokenizer needed)
+student = None
+if SCAM_DETECTOR == 'student':
+    try:
+        from student_model import StudentModel, STUDENT_PATH
+        student = StudentModel.load(STUDENT_PATH)
+        print(f"✓ Student Model Loaded Successfully! (agreement with CNN-LSTM: {student.report.get('agreement')})")
+    except Exception as e:
+        print(f"✗ Error loading student model: {e}")
+        student = None
+
 # Fallback: Keyword-based scam detection
 def detect_scam_keywords(text_transcript):
     """Fallback: Analyzes text using keyword heuristics"""
@@ -78,7 +98,7 @@ def detect_scam_keywords(text_transcript):
     keyword_count = sum(1 for keyword in scam_keywords if keyword in text_lower)
     
     prediction = min(keyword_count / 5, 1.0)
-    is_scam = bool(prediction > SCAM_THRESHOLD)
+    is_scam = bool(prediction > KEYWORD_THRESHOLD)
     confidence_score = round(float(prediction) * 100, 2)
     
     if not is_scam:
@@ -92,6 +112,15 @@ def detect_scam_trained(text_transcript):
     if not text_transcript or len(text_transcript.strip()) == 0:
         return None, None
     
+    if student is not None:
+        prediction = student.predict([text_transcript])[0]
+        is_scam = bool(prediction > SCAM_THRESHOLD)
+        confidence_score = round(float(prediction) * 100, 2)
+        if not is_scam:
+            confidence_score = round((1 - float(prediction)) * 100, 2)
+        print(f"[DetectStudent] Prediction: {prediction:.4f}, is_scam: {is_scam}, confidence: {confidence_score}")
+        return is_scam, confidence_score
+    
     if trained_model is None or tokenizer is None:
         print("[DetectTrained] Model or tokenizer not available, using keyword fallback")
         return detect_scam_keywords(text_transcript)
@@ -123,12 +152,16 @@ def detect_scam_trained(text_transcript):
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    model_status = "✓ Trained Model" if trained_model is not None else "✗ Fallback Keywords"
+    if student is not None:
+        model_status = "✓ Student Model"
+    else:
+        model_status = "✓ Trained Model" if trained_model is not None else "✗ Fallback Keywords"
     return jsonify({
         'status': 'online', 
         'message': f'Scam Detector API Running with {model_status}',
         'whisper': 'loaded' if stt_model else 'not_loaded',
-        'trained_model': 'loaded' if trained_model else 'not_loaded'
+        'trained_model': 'loaded' if trained_model else 'not_loaded',
+        'detector': 'student' if student is not None else SCAM_DETECTOR
     }), 200
 
 @app.route('/predict', methods=['POST'])
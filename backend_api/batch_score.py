@@ -0,0 +1,340 @@
+"""Offline bulk scorer for archives of call recordings and transcript exports.
+
+Runs the same pipeline as app.py (audio_codec decode -> Whisper -> detect_scam) without
+HTTP. Audio files are transcribed in a process pool, transcripts are scored in
+batches by the parent, and results are appended to JSONL/CSV/Parquet as they
+complete. Finished files, and how many records of a partly scored transcript
+export have been written, are recorded in a checkpoint so an interrupted job
+can be resumed by running the same command again.
+
+Usage:
+    python batch_score.py recordings/ exports/ -o results.jsonl --workers 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import audio_codec
+import pipeline
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.opus', '.aac'}
+TRANSCRIPT_EXTENSIONS = {'.txt', '.csv', '.jsonl'}
+# Column / field names accepted as the transcript in CSV and JSONL exports
+TEXT_FIELDS = ('TEXT', 'text', 'transcript', 'transcription')
+RESULT_FIELDS = ['source', 'record', 'kind', 'transcript', 'is_scam', 'confidence',
+                 'model_version', 'audio_seconds', 'error']
+
+
+#INPUT DISCOVERY
+def find_inputs(paths):
+    """Returns every audio and transcript file under the given paths, sorted"""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [os.path.join(root, name)
+                          for root, _, names in os.walk(path) for name in names]
+        for candidate in candidates:
+            extension = os.path.splitext(candidate)[1].lower()
+            if extension in AUDIO_EXTENSIONS or extension in TRANSCRIPT_EXTENSIONS:
+                found.append(os.path.abspath(candidate))
+    return sorted(set(found))
+
+
+def is_audio(path):
+    return os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+
+
+def read_transcripts(path):
+    """Yields (record id, text) pairs from a transcript file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.txt':
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            yield path, handle.read().strip()
+    elif extension == '.csv':
+        with open(path, newline='', encoding='utf-8', errors='replace') as handle:
+            reader = csv.DictReader(handle)
+            field = next((f for f in TEXT_FIELDS if f in (reader.fieldnames or [])), None)
+            if field is None:
+                raise ValueError(f"no transcript column (expected one of {', '.join(TEXT_FIELDS)})")
+            for row_number, row in enumerate(reader):
+                yield f"{path}#{row_number}", (row[field] or '').strip()
+    else:
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            for line_number, line in enumerate(handle):
+                if line.strip():
+                    row = json.loads(line)
+                    text = next((row[f] for f in TEXT_FIELDS if f in row), '')
+                    yield f"{path}#{line_number}", (text or '').strip()
+
+
+#AUDIO WORKERS
+def _init_worker(whisper_model):
+    """Loads Whisper once per worker process"""
+    pipeline.load_stt_model(whisper_model)
+
+
+def transcribe_file(path):
+    """Worker task: returns (path, transcript, audio seconds, error)"""
+    try:
+        # Same decoder as the HTTP uploads: WAV/FLAC/Ogg in memory, librosa only for the rest
+        audio_data, _ = audio_codec.decode_file(path)
+        transcript = pipeline.transcribe(audio_data) if len(audio_data) else ""
+        return path, transcript, round(len(audio_data) / pipeline.SAMPLE_RATE, 2), None
+    except Exception as e:
+        return path, "", None, str(e)
+
+
+#OUTPUT WRITERS
+class JsonlWriter:
+    def __init__(self, path):
+        self.handle = open(path, 'a', encoding='utf-8')
+
+    def write(self, rows):
+        for row in rows:
+            self.handle.write(json.dumps(row) + "\n")
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.handle = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.handle, fieldnames=RESULT_FIELDS)
+        if is_new:
+            self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class ParquetWriter:
+    """Writes row groups as results arrive; a resumed job writes a new part file"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        base, extension = os.path.splitext(path)
+        part = 1
+        while os.path.exists(path):
+            path = f"{base}.part{part}{extension}"
+            part += 1
+        self.pa = pa
+        self.schema = pa.schema([
+            ('source', pa.string()), ('record', pa.string()), ('kind', pa.string()),
+            ('transcript', pa.string()), ('is_scam', pa.bool_()), ('confidence', pa.float64()),
+            ('model_version', pa.string()),
+            ('audio_seconds', pa.float64()), ('error', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if rows:
+            self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+#CHECKPOINT
+def load_checkpoint(path):
+    """Returns (finished files, records already written per partly scored file).
+
+    A line is either a finished file or "<file>\t<records written>".
+    """
+    done, offsets = set(), {}
+    if not os.path.exists(path):
+        return done, offsets
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            source, _, offset = line.partition('\t')
+            if offset:
+                offsets[source] = int(offset)
+            else:
+                done.add(source)
+    return done, {source: offset for source, offset in offsets.items() if source not in done}
+
+
+class BatchScorer:
+    """Buffers transcripts, scores and writes them batch_size at a time and
+    checkpoints each file's progress"""
+
+    def __init__(self, writer, checkpoint_path, batch_size, total_files, offsets=None):
+        self.writer = writer
+        self.checkpoint = open(checkpoint_path, 'a', encoding='utf-8')
+        self.batch_size = batch_size
+        self.total_files = total_files
+        self.pending = []            # rows waiting for the text model
+        self.open_records = {}       # source file -> rows not yet written
+        self.written = dict(offsets or {})  # source file -> records written, resumed ones included
+        self.finished_sources = []   # files whose rows are all buffered
+        self.files_done = 0
+        self.records_done = 0
+        self.audio_seconds = 0.0
+        self.started = time.time()
+
+    def add(self, row):
+        """Queues one record; the records of a file must be added in order"""
+        self.open_records[row['source']] = self.open_records.get(row['source'], 0) + 1
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def finish_source(self, source):
+        """Marks a file as completely queued (it is checkpointed once its rows are written)"""
+        self.open_records.setdefault(source, 0)
+        self.finished_sources.append(source)
+        self._checkpoint_finished()
+
+    def flush(self):
+        while self.pending:
+            rows, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self._score(rows)
+        self._checkpoint_finished()
+
+    def _score(self, rows):
+        to_score = [row for row in rows if row['error'] is None]
+        verdicts = pipeline.analyze_texts([row['transcript'] for row in to_score])
+        for row, verdict in zip(to_score, verdicts):
+            row.update({field: verdict[field] for field in ('is_scam', 'confidence', 'model_version')})
+        self.writer.write(rows)
+
+        for row in rows:
+            self.open_records[row['source']] -= 1
+            self.written[row['source']] = self.written.get(row['source'], 0) + 1
+            self.audio_seconds += row['audio_seconds'] or 0
+        self.records_done += len(rows)
+        for source in dict.fromkeys(row['source'] for row in rows):
+            self.checkpoint.write(f"{source}\t{self.written[source]}\n")
+        self.checkpoint.flush()
+        self.report()
+
+    def _checkpoint_finished(self):
+        still_open = []
+        for source in self.finished_sources:
+            if self.open_records[source] == 0:
+                del self.open_records[source]
+                self.written.pop(source, None)
+                self.checkpoint.write(source + "\n")
+                self.files_done += 1
+            else:
+                still_open.append(source)
+        self.finished_sources = still_open
+        self.checkpoint.flush()
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        files_per_second = self.files_done / elapsed
+        remaining = self.total_files - self.files_done
+        eta = remaining / files_per_second if files_per_second > 0 else float('inf')
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta != float('inf') else '--:--:--'
+        print(f"[BATCH] {self.files_done}/{self.total_files} files, {self.records_done} records | "
+              f"{files_per_second:.2f} files/s, {self.records_done / elapsed:.1f} records/s, "
+              f"{self.audio_seconds / elapsed:.1f} audio-s/s | ETA {eta_text}")
+
+    def close(self):
+        self.flush()
+        self.checkpoint.close()
+
+
+def _row(source, record, kind, transcript="", audio_seconds=None, error=None):
+    return {'source': source, 'record': record, 'kind': kind, 'transcript': transcript,
+            'is_scam': None, 'confidence': None, 'model_version': None, 'audio_seconds': audio_seconds, 'error': error}
+
+
+def run(args):
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if output_format not in WRITERS:
+        print(f"ERROR: Unsupported output format '{output_format}' (use jsonl, csv or parquet)")
+        return 1
+    checkpoint_path = args.checkpoint or args.output + '.checkpoint'
+
+    # Never read back the results file (it may sit in an input directory)
+    inputs = [path for path in find_inputs(args.inputs) if path != os.path.abspath(args.output)]
+    done, offsets = load_checkpoint(checkpoint_path)
+    todo = [path for path in inputs if path not in done]
+    audio_files = [path for path in todo if is_audio(path)]
+    transcript_files = [path for path in todo if not is_audio(path)]
+    print(f"[BATCH] {len(inputs)} files found, {len(done & set(inputs))} already done, "
+          f"{len(audio_files)} audio + {len(transcript_files)} transcript files to score")
+    if not todo:
+        return 0
+
+    # Start the audio workers before TensorFlow is loaded in this process
+    pool = None
+    if audio_files:
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(args.workers, initializer=_init_worker, initargs=(args.whisper_model,))
+
+    print("Loading Scam Detection Model (CNN-LSTM)...")
+    pipeline.load_text_model()
+
+    writer = WRITERS[output_format](args.output)
+    scorer = BatchScorer(writer, checkpoint_path, args.batch_size, len(todo), offsets)
+    try:
+        for path in transcript_files:
+            # Skip the records an interrupted run already wrote
+            records = itertools.islice(read_transcripts(path), offsets.get(path, 0), None)
+            try:
+                for record, text in records:
+                    scorer.add(_row(path, record, 'text', text))
+            except Exception as e:
+                scorer.add(_row(path, path, 'text', error=str(e)))
+            scorer.finish_source(path)
+
+        if pool is not None:
+            for path, transcript, audio_seconds, error in pool.imap_unordered(transcribe_file, audio_files):
+                if error:
+                    print(f"[BATCH] Failed {path}: {error}")
+                scorer.add(_row(path, path, 'audio', transcript, audio_seconds, error))
+                scorer.finish_source(path)
+        scorer.close()
+    except KeyboardInterrupt:
+        # Everything already written is checkpointed; rerun to resume
+        print("\n[BATCH] Interrupted - rerun the same command to resume")
+        return 130
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.terminate()
+
+    elapsed = time.time() - scorer.started
+    print(f"[BATCH] Done: {scorer.records_done} records from {scorer.files_done} files "
+          f"in {elapsed:.1f}s -> {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk scam scoring of recordings and transcripts")
+    parser.add_argument('inputs', nargs='+', help="Files or directories to score")
+    parser.add_argument('-o', '--output', required=True, help="Results file (.jsonl, .csv or .parquet)")
+    parser.add_argument('--format', choices=sorted(WRITERS), help="Override the output format")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Whisper worker processes")
+    parser.add_argument('--batch-size', type=int, default=64, help="Transcripts per model call")
+    parser.add_argument('--whisper-model', default=pipeline.WHISPER_MODEL)
+    return run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
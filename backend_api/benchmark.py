@@ -0,0 +1,284 @@
+"""Offline micro-benchmarks for every stage of the scam detection pipeline.
+
+Runs without a GPU, a network or trained models. By default Whisper and the
+CNN-LSTM are replaced by deterministic stand-ins with a similar cost profile,
+so results measure our own code (keyword matching, tokenization/windowing,
+batching, audio decode, Flask endpoints) and are stable between runs. Use
+--real to benchmark the actual models instead.
+
+Usage:
+    python benchmark.py                    # run, compare against the baseline if present
+    python benchmark.py --save-baseline    # run and store results as the new baseline
+    python benchmark.py -k endpoint        # only benchmarks whose name contains 'endpoint'
+
+Exits with status 1 if any benchmark's median is more than --threshold slower
+than the baseline. Baselines are machine-specific; save one per machine.
+"""
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import zlib
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(HERE, '..', 'mobile_app', 'assets', 'audio')
+DATASET = os.path.join(HERE, 'call_transcript_cleaned.csv')
+BASELINE = os.path.join(HERE, 'benchmarks', 'baseline.json')
+
+sys.path.insert(0, HERE)
+import pipeline  # noqa: E402
+
+
+#STAND-IN MODELS
+class StandInWhisper:
+    """Deterministic Whisper replacement: cost grows with audio length like the real encoder"""
+
+    WORDS = ["hello", "this", "is", "your", "bank", "calling", "about", "the", "account",
+             "please", "confirm", "dinner", "tonight", "thanks", "bye"]
+
+    def transcribe(self, audio, **options):
+        audio = np.asarray(audio, dtype=np.float32)
+        # Frame energy via an FFT over 25 ms frames, roughly the work of a log-mel front end
+        frames = audio[:len(audio) // 400 * 400].reshape(-1, 400)
+        energy = np.abs(np.fft.rfft(frames, axis=1)).sum(axis=1) if len(frames) else np.zeros(1)
+        seed = zlib.crc32(energy.astype(np.float32).tobytes())
+        n_words = max(1, len(audio) // 8000)
+        words = [self.WORDS[(seed + i * 7) % len(self.WORDS)] for i in range(n_words)]
+        return {"text": " " + " ".join(words)}
+
+
+class StandInTokenizer:
+    """Hash-based vocabulary with the Keras Tokenizer interface"""
+
+    def __init__(self, num_words=5000):
+        self.num_words = num_words
+
+    def texts_to_sequences(self, texts):
+        return [[zlib.crc32(word.encode()) % (self.num_words - 1) + 1
+                 for word in text.lower().replace(',', ' ').replace('.', ' ').split()]
+                for text in texts]
+
+
+class StandInCnnLstm:
+    """Random-weight Embedding -> Conv1D -> MaxPool -> recurrent -> Dense stack in NumPy"""
+
+    def __init__(self, vocab_size=5000, embedding_dim=100, filters=128, kernel_size=5, units=64):
+        rng = np.random.default_rng(0)
+        self.embedding = rng.normal(0, 0.05, (vocab_size, embedding_dim)).astype(np.float32)
+        self.kernel = rng.normal(0, 0.05, (kernel_size * embedding_dim, filters)).astype(np.float32)
+        self.recurrent_in = rng.normal(0, 0.05, (filters, units)).astype(np.float32)
+        self.recurrent = rng.normal(0, 0.05, (units, units)).astype(np.float32)
+        self.dense = rng.normal(0, 0.05, (units,)).astype(np.float32)
+        self.kernel_size = kernel_size
+
+    def predict(self, batch, verbose=0):
+        x = self.embedding[np.asarray(batch)]                       # (n, T, E)
+        steps = x.shape[1] - self.kernel_size + 1
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.kernel_size, axis=1)[:, :steps]
+        conv = np.maximum(windows.transpose(0, 1, 3, 2).reshape(len(x), steps, -1) @ self.kernel, 0)
+        pooled = conv[:, :steps // 2 * 2].reshape(len(x), steps // 2, 2, -1).max(axis=2)
+        inputs = pooled @ self.recurrent_in
+        h = np.zeros((len(x), self.recurrent.shape[0]), dtype=np.float32)
+        for t in range(inputs.shape[1]):
+            h = np.tanh(inputs[:, t] + h @ self.recurrent)
+        return (1 / (1 + np.exp(-(h @ self.dense))))[:, None]
+
+
+def install_models(real):
+    """Puts stand-ins (or the real models) into the pipeline"""
+    if real:
+        pipeline.load_stt_model()
+        pipeline.load_text_model()
+        return "real"
+    pipeline.stt_model = StandInWhisper()
+    pipeline.active_text_model = pipeline.TextModel(StandInCnnLstm(), StandInTokenizer(), 'stand-in')
+    return "stand-in"
+
+
+#INPUTS
+def load_transcripts():
+    with open(DATASET, newline='', encoding='utf-8') as handle:
+        return [row['TEXT'] for row in csv.DictReader(handle)]
+
+
+def long_transcript(transcripts, words=600):
+    text = " ".join(transcripts)
+    return " ".join(text.split()[:words])
+
+
+def bundled_audio():
+    return sorted(glob.glob(os.path.join(AUDIO_DIR, '*.wav')))
+
+
+def _has(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+#BENCHMARKS
+def build_benchmarks(transcripts, selected):
+    """Returns {name: zero-argument callable}"""
+    benchmarks = {}
+    safe_texts = [text for text in transcripts if not pipeline.keyword_hits(text)] or transcripts
+    text_model = pipeline.active_text_model
+
+    benchmarks['keywords/all_transcripts'] = lambda: [pipeline.keyword_hits(text) for text in transcripts]
+    benchmarks['tokenize/32_transcripts'] = lambda: text_model.tokenizer.texts_to_sequences(transcripts[:32])
+    benchmarks['windows/long_transcript'] = lambda: pipeline.sliding_windows(
+        len(text_model.tokenizer.texts_to_sequences([long_transcript(transcripts)])[0]))
+
+    for batch_size in (1, 8, 32, 128):
+        batch = np.random.default_rng(batch_size).integers(1, 5000, (batch_size, pipeline.MAX_LENGTH)).astype('int32')
+        benchmarks[f'model/batch_{batch_size}'] = (lambda b=batch: text_model.model.predict(b, verbose=0))
+
+    benchmarks['analyze/1_short'] = lambda: pipeline.analyze_texts(safe_texts[:1])
+    benchmarks['analyze/32_short'] = lambda: pipeline.analyze_texts(safe_texts[:32])
+    benchmarks['analyze/1_long_windowed'] = lambda: pipeline.analyze_texts([long_transcript(safe_texts)])
+
+    audio_files = bundled_audio()
+    if audio_files and _has('soundfile') and _has('scipy'):
+        import audio_codec
+        import soundfile as sf
+        raw = open(audio_files[0], 'rb').read()
+        benchmarks['audio/decode_resample_wav'] = lambda: audio_codec.decode_upload(raw, 'test.wav')
+        # A 5 second 16 kHz mono chunk, as the live path uploads
+        audio_16k, _ = audio_codec.decode_upload(raw, 'test.wav')
+        chunk = io.BytesIO()
+        sf.write(chunk, audio_16k[:5 * pipeline.SAMPLE_RATE], pipeline.SAMPLE_RATE, format='WAV', subtype='PCM_16')
+        chunk_wav = chunk.getvalue()
+        flac = io.BytesIO()
+        sf.write(flac, audio_16k[:5 * pipeline.SAMPLE_RATE], pipeline.SAMPLE_RATE, format='FLAC')
+        chunk_flac = flac.getvalue()
+        benchmarks['audio/decode_chunk_wav'] = lambda: audio_codec.decode_upload(chunk_wav, 'chunk.wav')
+        benchmarks['audio/decode_chunk_flac'] = lambda: audio_codec.decode_upload(chunk_flac, 'chunk.flac')
+        benchmarks['stt/5s_chunk'] = lambda: pipeline.transcribe(audio_16k[:5 * pipeline.SAMPLE_RATE])
+    else:
+        chunk_wav = raw = None
+
+    if _has('flask') and (not selected or any('endpoint' in name for name in selected)):
+        # Keep endpoint timings about the request path, not disk writes or workers
+        os.environ['RESULT_STORE'] = ''
+        os.environ['INFERENCE_WORKERS'] = '0'
+        import app as scam_app
+        client = scam_app.app.test_client()
+        scam_text = "Your account is suspended, confirm the OTP now"
+        safe_text = safe_texts[0]
+        benchmarks['endpoint/detect_keyword'] = lambda: client.post('/detect', json={'text': scam_text})
+        benchmarks['endpoint/detect_model'] = lambda: client.post('/detect', json={'text': safe_text})
+        benchmarks['endpoint/health'] = lambda: client.get('/health')
+        if chunk_wav is not None:
+            benchmarks['endpoint/stream_chunk'] = lambda: client.post(
+                '/stream', data={'chunk': (io.BytesIO(chunk_wav), 'chunk.wav'), 'chunk_index': '0'})
+            benchmarks['endpoint/predict_file'] = lambda: client.post(
+                '/predict', data={'file': (io.BytesIO(raw), 'call.wav')})
+
+    if selected:
+        benchmarks = {name: fn for name, fn in benchmarks.items() if any(key in name for key in selected)}
+    return benchmarks
+
+
+def measure(fn, min_time, min_rounds):
+    """Times fn until both min_time seconds and min_rounds calls have passed"""
+    timings = []
+    # The endpoints log every request; keep that out of the report
+    with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+        fn()  # Warm-up (first-call allocations, lazy imports)
+        started = time.perf_counter()
+        while len(timings) < min_rounds or time.perf_counter() - started < min_time:
+            t0 = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - t0)
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "median_ms": round(statistics.median(timings) * 1000, 4),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))] * 1000, 4),
+        "min_ms": round(timings[0] * 1000, 4),
+        "ops_per_second": round(len(timings) / sum(timings), 1)
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints a comparison table; returns names of regressed benchmarks"""
+    regressions = []
+    print(f"\n{'benchmark':36} {'baseline':>11} {'now':>11} {'change':>8}")
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:36} {'-':>11} {result['median_ms']:>9.3f}ms {'new':>8}")
+            continue
+        change = result['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0
+        flag = "  << REGRESSION" if change > threshold else ""
+        print(f"{name:36} {previous['median_ms']:>9.3f}ms {result['median_ms']:>9.3f}ms {change:>+7.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline micro-benchmarks")
+    parser.add_argument('-k', dest='selected', action='append', help="Only run benchmarks containing this text")
+    parser.add_argument('--real', action='store_true', help="Use the real Whisper and CNN-LSTM models")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%)")
+    parser.add_argument('--min-time', type=float, default=0.5, help="Seconds to spend per benchmark")
+    parser.add_argument('--min-rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    models = install_models(args.real)
+    transcripts = load_transcripts()
+    benchmarks = build_benchmarks(transcripts, args.selected)
+
+    print(f"Running {len(benchmarks)} benchmarks ({models} models)")
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = measure(fn, args.min_time, args.min_rounds)
+        r = results[name]
+        print(f"  {name:36} median {r['median_ms']:>9.3f}ms  p95 {r['p95_ms']:>9.3f}ms  ({r['rounds']} rounds)")
+
+    report = {
+        "models": models,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.processor(), "cpus": os.cpu_count()},
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results
+    }
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline yet - run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    if baseline.get("models") != models:
+        print(f"\nBaseline was recorded with {baseline.get('models')} models; not comparing.")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    print(f"\nOK: no benchmark slower than baseline by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Whisper worker processes fed through shared memory instead of pickled arrays.
+
+The pool owns one shared-memory block cut into fixed-size PCM slots. A
+front-end (any HTTP worker) takes a free slot, writes the decoded 16 kHz
+float32 audio into it once and queues a small descriptor (request id, slot,
+sample count, options). An inference worker transcribes the samples in place
+and sends the text back on that slot's pipe. The front-end returns the slot
+to the free list once it has read the reply, so total shared memory is fixed
+at slots x slot length however many requests are waiting.
+
+Create the pool after the models are loaded and before serving: with the
+fork start method the workers inherit Whisper's weights copy-on-write, and
+pre-forked HTTP workers (serve_prefork.py) inherit the queues and slots.
+That is why the queues are SimpleQueues plus a semaphore: a
+multiprocessing.Queue hands put() to a feeder thread, which a raw os.fork()
+child does not have, so slots returned there would never reach the others.
+
+Each worker publishes the slot and request it is working on in shared
+arrays. The owner process runs supervise() (a thread started by
+start_supervisor(), or serve_prefork.py's parent loop). It restarts workers
+that died, kills and restarts workers stuck on one request for more than
+twice the timeout, and answers their request with an error. The slot is
+then freed by whichever front-end is waiting on it.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import pipeline
+import thread_budget
+
+BYTES_PER_SAMPLE = np.dtype(np.float32).itemsize
+
+
+def _slot_view(buffer, slot, slot_samples, n_samples):
+    """float32 view of the first n_samples of a slot (no copy)"""
+    return np.ndarray((n_samples,), dtype=np.float32, buffer=buffer,
+                      offset=slot * slot_samples * BYTES_PER_SAMPLE)
+
+
+def _profile_listener(control):
+    """Samples this worker's threads whenever the front-end asks (InferencePool.sample)"""
+    from profiling import sample_process
+    while True:
+        sample_id, seconds, interval = control.recv()
+        control.send((sample_id, sample_process(seconds, interval)))
+
+
+def _worker(shm, shm_name, slot_samples, tasks, result_pipes, index=0, workers=1, pin=False, control=None,
+            busy=None):
+    """Inference worker: transcribe audio straight out of shared memory
+
+    busy is (slot per worker, request id pid/seq pairs, start time per worker),
+    read by InferencePool.supervise().
+    """
+    if control is not None:
+        threading.Thread(target=_profile_listener, args=(control,), daemon=True, name='profile-listener').start()
+    if shm is None:
+        # Spawn start method: attach to the block by name
+        shm = shared_memory.SharedMemory(name=shm_name)
+    pinned_cores = thread_budget.pin_worker(index, workers) if pin else None
+    pipeline.load_stt_model()
+    # A pinned worker uses exactly its own cores
+    thread_budget.configure_torch(pinned_cores)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, slot, n_samples, options = task
+        if busy is not None:
+            busy[1][2 * index:2 * index + 2] = request_id
+            busy[2][index] = time.time()
+            busy[0][index] = slot
+        try:
+            audio =_slot_view(shm.buf, slot, slot_samples, n_samples)
+            result = (request_id, pipeline.transcribe(audio, **options), None)
+            del audio  # Drop the view before the slot can be reused
+        except Exception as e:
+            result = (request_id, "", str(e))
+        result_pipes[slot].send(result)
+        if busy is not None:
+            # Cleared after the reply: a worker dying in between gets a duplicate error reply, which is skipped
+            busy[0][index] = -1
+
+
+class InferencePool:
+    """Bounded pool of Whisper processes reading PCM from shared-memory slots"""
+
+    def __init__(self, workers=2, slots=8, slot_seconds=30, timeout=120):
+        self.slot_samples = int(slot_seconds * pipeline.SAMPLE_RATE)
+        self.slot_count = slots
+        self.timeout = timeout
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_samples * BYTES_PER_SAMPLE)
+        self.owner_pid = os.getpid()
+        self.tasks = context.SimpleQueue()
+        self.free_slots = context.SimpleQueue()
+        # Counts the slot ids in free_slots, so taking one can time out
+        self.free_count = context.Semaphore(slots)
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        pipes = [context.Pipe(duplex=False) for _ in range(slots)]
+        self.result_readers = [reader for reader, _ in pipes]
+        self.result_writers = [writer for _, writer in pipes]
+        self.request_ids = itertools.count()
+        # Profiling: one duplex pipe per worker, used by one front-end at a time
+        controls = [context.Pipe() for _ in range(workers)]
+        self.profile_pipes = [front for front, _ in controls]
+        self.profile_lock = context.Lock()
+
+        # Which slot / request each worker is busy with (-1: idle), for supervise()
+        self.busy = (context.RawArray('i', [-1] * workers), context.RawArray('q', 2 * workers),
+                     context.RawArray('d', workers))
+        self.hung_after = 2 * timeout
+        self.restarts = 0
+        self.closing = False
+
+        shared = self.shm if start_method == 'fork' else None
+        self.context = context
+        self.worker_args = [
+            (shared, self.shm.name, self.slot_samples, self.tasks, self.result_writers, index, workers,
+             bool(thread_budget.budget.get("pin_workers")), controls[index][1], self.busy)
+            for index in range(workers)
+        ]
+        self.processes = [self._start_worker(index) for index in range(workers)]
+        print(f"[POOL] {workers} inference workers, {slots} x {slot_seconds}s slots "
+              f"({self.shm.size / 1024 / 1024:.1f} MB shared, {start_method})")
+
+    def _start_worker(self, index):
+        process = self.context.Process(target=_worker, daemon=True, args=self.worker_args[index])
+        process.start()
+        return process
+
+    def supervise(self):
+        """Restarts dead or stuck workers and fails their request (owner process only)"""
+        if os.getpid() != self.owner_pid or self.closing:
+            return
+        slots, requests, since = self.busy
+        for index, process in enumerate(self.processes):
+            stuck = slots[index] >= 0 and time.time() - since[index] > self.hung_after
+            if process.is_alive() and not stuck:
+                continue
+            if stuck:
+                print(f"[POOL] Worker {index} (pid {process.pid}) stuck for {time.time() - since[index]:.0f}s, killing it")
+                process.kill()
+            process.join(timeout=5)
+            slot = slots[index]
+            if slot >= 0:
+                # Frees the slot in the front-end waiting on it
+                request_id = (requests[2 * index], requests[2 * index + 1])
+                self.result_writers[slot].send((request_id, "", "Inference worker died"))
+                slots[index] = -1
+            print(f"[POOL] Worker {index} (pid {process.pid}, exit code {process.exitcode}) restarted")
+            self.processes[index] = self._start_worker(index)
+            self.restarts += 1
+
+    def start_supervisor(self, interval=1.0):
+        """Runs supervise() every interval seconds in a daemon thread of this (owner) process"""
+        def run():
+            while not self.closing:
+                self.supervise()
+                time.sleep(interval)
+        threading.Thread(target=run, daemon=True, name='pool-supervisor').start()
+
+    def fits(self, audio):
+        return len(audio) <= self.slot_samples
+
+    def transcribe(self, audio, timings=None, **options):
+        """Transcribes a waveform in a worker process; blocks while all slots are busy
+
+        With a timings dict, the wait for a free slot is added to timings["queue_seconds"].
+        """
+        if not self.fits(audio):
+            raise ValueError(f"Audio longer than a pool slot ({self.slot_samples} samples)")
+        queued = time.perf_counter()
+        acquired = self.free_count.acquire(timeout=self.timeout)
+        if timings is not None:
+            timings["queue_seconds"] = timings.get("queue_seconds", 0.0) + time.perf_counter() - queued
+        if not acquired:
+            raise TimeoutError("No free inference slot")
+        slot = self.free_slots.get()
+
+        # Unique across pre-forked front-ends sharing this pool
+        request_id = (os.getpid(), next(self.request_ids))
+        _slot_view(self.shm.buf, slot, self.slot_samples, len(audio))[:] = audio
+        self.tasks.put((request_id, slot, len(audio), options))
+
+        reply = self._wait_for_reply(slot, request_id, self.timeout)
+        if reply is None:
+            # The worker may still be reading the slot: free it only once it answers
+            # (supervise() answers for it if it dies or stays stuck)
+            threading.Thread(target=self._wait_for_reply, args=(slot, request_id, None),
+                             daemon=True).start()
+            raise TimeoutError("Inference worker did not answer in time")
+        _, text, error = reply
+        if error:
+            raise RuntimeError(error)
+        return text
+
+    def _wait_for_reply(self, slot, request_id, timeout):
+        """Reads the slot's pipe until this request's reply arrives, then frees the slot"""
+        reader = self.result_readers[slot]
+        while reader.poll(timeout):
+            reply = reader.recv()
+            if reply[0] == request_id:
+                self.free_slots.put(slot)
+                self.free_count.release()
+                return reply
+        return None
+
+    def sample(self, seconds, interval):
+        """Samples every worker's stacks for seconds; returns {"inference-worker-<n>": Counter}"""
+        sample_id = (os.getpid(), next(self.request_ids))
+        samples = {}
+        with self.profile_lock:
+            for pipe in self.profile_pipes:
+                pipe.send((sample_id, seconds, interval))
+            deadline = time.perf_counter() + seconds + 5
+            for index, pipe in enumerate(self.profile_pipes):
+                # A dead or stuck worker is left out; stale replies from an earlier sample are skipped
+                while pipe.poll(max(deadline - time.perf_counter(), 0)):
+                    reply_id, stacks = pipe.recv()
+                    if reply_id == sample_id:
+                        samples[f"inference-worker-{index}"] = stacks
+                        break
+        return samples
+
+    def stats(self):
+        try:
+            free = self.free_count.get_value()
+        except NotImplementedError:  # macOS
+            free = None
+        # Only the creating process can poll its children
+        alive = (sum(process.is_alive() for process in self.processes)
+                 if os.getpid() == self.owner_pid else None)
+        return {
+            "workers": alive,
+            "worker_restarts": self.restarts if os.getpid() == self.owner_pid else None,
+            "slots_total": self.slot_count,
+            "slots_free": free,
+            "slot_seconds": self.slot_samples / pipeline.SAMPLE_RATE,
+            "shared_mb": round(self.shm.size / 1024 / 1024, 1),
+        }
+
+    def close(self):
+        """Stops the workers and frees the shared block (owner process only)"""
+        if os.getpid() != self.owner_pid:
+            return
+        self.closing = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.shm.close()
+        self.shm.unlink()
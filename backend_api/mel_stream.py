@@ -0,0 +1,187 @@
+"""Incremental log-mel features for live /stream sessions.
+
+whisper.transcribe() starts from raw samples, so decoding a rolling window
+recomputes the STFT and mel filterbank for every second of audio still in the
+window. A MelStream instead keeps a per-session ring buffer of log-mel frames:
+each uploaded chunk only adds the frames for its own samples, and a decode
+window is a contiguous slice of the buffer. Feature cost is proportional to
+new audio, not to the window length.
+
+Frames match whisper.log_mel_spectrogram (400-point Hann STFT, hop 160,
+reflect padding at the start of the call). The max-8 clamp and (x+4)/4
+scaling depend on the whole window, so they are applied when a window is
+sliced, not when frames are stored.
+
+Sessions are held in the memory of one process, so every chunk of a call
+must reach the same process: one app.py per port, with router.py in front
+of several. serve_prefork.py rejects session requests.
+"""
+import io
+import threading
+import time
+
+import numpy as np
+
+from pipeline import SAMPLE_RATE, decoded_text
+
+N_FFT = 400
+HOP_LENGTH = 160
+FRAMES_PER_SECOND = SAMPLE_RATE // HOP_LENGTH
+N_FRAMES = 30 * FRAMES_PER_SECOND  # Whisper always decodes a 30 second mel
+LOG_FLOOR = -10.0  # log10 of Whisper's 1e-10 clamp (also the value of silence padding)
+
+_hann = np.hanning(N_FFT + 1)[:-1].astype(np.float32)  # Periodic, like torch.hann_window
+_filters = {}
+
+
+def mel_filters(n_mels):
+    """Whisper's mel filterbank as a NumPy array, loaded once per size"""
+    if n_mels not in _filters:
+        from whisper.audio import mel_filters as whisper_mel_filters
+        _filters[n_mels] = whisper_mel_filters('cpu', n_mels).numpy()
+    return _filters[n_mels]
+
+
+class MelStream:
+    """Ring buffer of log-mel frames for one call"""
+
+    def __init__(self, n_mels=80, window_seconds=30):
+        self.n_mels = n_mels
+        self.capacity = min(window_seconds, 30) * FRAMES_PER_SECOND
+        # Every frame is written twice (t and t + capacity), so the newest
+        # `capacity` frames are always one contiguous slice
+        self.frames = np.full((n_mels, 2 * self.capacity), LOG_FLOOR, dtype=np.float32)
+        self.total_frames = 0
+        self.pending = np.zeros(0, dtype=np.float32)  # Samples not yet covered by a full frame
+        self.started = False
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def append(self, audio):
+        """Computes frames for the new samples only; returns how many were added"""
+        self.last_used = time.time()
+        samples = np.concatenate([self.pending, np.asarray(audio, dtype=np.float32)])
+        if not self.started:
+            if len(samples) <= N_FFT // 2:
+                self.pending = samples
+                return 0
+            # Same reflect padding torch.stft(center=True) applies at the start
+            samples = np.concatenate([samples[1:N_FFT // 2 + 1][::-1], samples])
+            self.started = True
+
+        n_new = (len(samples) - N_FFT) // HOP_LENGTH + 1 if len(samples) >= N_FFT else 0
+        if n_new > 0:
+            windows = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP_LENGTH][:n_new]
+            power = np.abs(np.fft.rfft(windows * _hann, axis=1)) ** 2
+            log_mel = np.log10(np.maximum(mel_filters(self.n_mels) @ power.T, 1e-10)).astype(np.float32)
+            self._store(log_mel)
+        self.pending = samples[n_new * HOP_LENGTH:]
+        return n_new
+
+    def _store(self, log_mel):
+        skipped = max(0, log_mel.shape[1] - self.capacity)
+        log_mel = log_mel[:, skipped:]
+        self.total_frames += skipped
+        positions = (self.total_frames + np.arange(log_mel.shape[1])) % self.capacity
+        self.frames[:, positions] = log_mel
+        self.frames[:, positions + self.capacity] = log_mel
+        self.total_frames += log_mel.shape[1]
+
+    def window(self, seconds=None):
+        """View of the newest frames (un-normalized log10 mel), oldest first"""
+        n = min(self.total_frames, self.capacity)
+        if seconds is not None:
+            n = min(n, int(seconds * FRAMES_PER_SECOND))
+        end = self.total_frames % self.capacity + self.capacity
+        return self.frames[:, end - n:end]
+
+    def model_input(self, seconds=None):
+        """Window padded with silence to 30 s and normalized as Whisper does"""
+        frames = self.window(seconds)
+        mel = np.full((self.n_mels, N_FRAMES), LOG_FLOOR, dtype=np.float32)
+        mel[:, :frames.shape[1]] = frames
+        mel = np.maximum(mel, mel.max() - 8.0)
+        return (mel + 4.0) / 4.0
+
+    def export_state(self):
+        """Serializes the buffered frames so another replica can continue the call"""
+        buffer = io.BytesIO()
+        np.savez(buffer, frames=self.window(), pending=self.pending,
+                 counters=np.array([self.n_mels, self.capacity, self.total_frames, int(self.started)]))
+        return buffer.getvalue()
+
+    @classmethod
+    def import_state(cls, data):
+        state = np.load(io.BytesIO(data))
+        n_mels, capacity, total_frames, started = (int(value) for value in state["counters"])
+        stream = cls(n_mels, capacity // FRAMES_PER_SECOND)
+        stream.total_frames = total_frames - state["frames"].shape[1]
+        stream._store(state["frames"])
+        stream.pending = state["pending"]
+        stream.started = bool(started)
+        return stream
+
+    def decode(self, model, seconds=None, **options):
+        """Runs whisper.decode on the newest window and returns the text ("" if it is silence)"""
+        import torch
+        import whisper
+        mel = torch.from_numpy(self.model_input(seconds)).to(model.device)
+        options.setdefault('fp16', model.device.type == 'cuda')
+        result = whisper.decode(model, mel, whisper.DecodingOptions(**options))
+        return decoded_text(result)
+
+
+class MelSessions:
+    """MelStreams by session id, dropped after `ttl` seconds without audio"""
+
+    def __init__(self, window_seconds=30, ttl=300, max_sessions=1000):
+        self.window_seconds = window_seconds
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id, n_mels):
+        with self.lock:
+            self._expire()
+            stream = self.sessions.get(session_id)
+            if stream is None:
+                if len(self.sessions) >= self.max_sessions:
+                    oldest = min(self.sessions, key=lambda key: self.sessions[key].last_used)
+                    del self.sessions[oldest]
+                stream = self.sessions[session_id] = MelStream(n_mels, self.window_seconds)
+            return stream
+
+    def export(self, session_id):
+        """Removes a session and returns its serialized state (None if unknown)"""
+        with self.lock:
+            stream = self.sessions.pop(session_id, None)
+        if stream is None:
+            return None
+        with stream.lock:  # Let an in-flight chunk finish first
+            return stream.export_state()
+
+    def restore(self, session_id, data):
+        stream = MelStream.import_state(data)
+        with self.lock:
+            self.sessions[session_id] = stream
+
+    def ids(self):
+        with self.lock:
+            self._expire()
+            return list(self.sessions)
+
+    def end(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id in [key for key, stream in self.sessions.items() if stream.last_used < cutoff]:
+            del self.sessions[session_id]
+
+    def stats(self):
+        with self.lock:
+            return {"active_sessions": len(self.sessions),
+                    "buffered_seconds": round(sum(min(s.total_frames, s.capacity) for s in self.sessions.values())
+                                              / FRAMES_PER_SECOND, 1)}
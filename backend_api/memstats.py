@@ -0,0 +1,25 @@
+"""Per-process memory accounting (Linux /proc) for comparing serving modes.
+
+RSS counts every resident page, including ones shared with other workers.
+PSS divides shared pages between the processes mapping them, so summing PSS
+across workers gives the real footprint of a pre-forked pool.
+"""
+import os
+
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def memory_usage(pid=None):
+    """Returns RSS/PSS/shared/private memory of a process in MB (empty if unavailable)"""
+    pid = pid or os.getpid()
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as handle:
+            for line in handle:
+                key, _, value = line.partition(':')
+                if key in FIELDS:
+                    usage[key.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        return {}
+    usage['pid'] = pid
+    return usage
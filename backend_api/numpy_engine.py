@@ -0,0 +1,190 @@
+"""Pure NumPy forward pass of the train_model.py CNN-LSTM, for a slim text-only server.
+
+Running the model through Keras means importing TensorFlow (and app.py also
+pulls in Whisper and torch): gigabytes of install and seconds of start-up
+for Embedding -> Conv1D+ReLU -> MaxPooling1D -> LSTM -> Dense. This module
+runs the same layers with NumPy from weights exported to .npz, vectorized
+over the batch. The tokenizer is exported to JSON and re-implemented here,
+so neither pickle nor Keras is needed at serve time.
+
+Serve it with SCAM_DETECTOR=numpy (TEXT_ONLY=1 also skips Whisper), e.g.
+    pip install -r requirements-text.txt
+    TEXT_ONLY=1 SCAM_DETECTOR=numpy python app.py
+
+Usage:
+    python numpy_engine.py export   # scam_detector_model.h5 + tokenizer.pickle -> .npz + .json
+    python numpy_engine.py check    # parity with Keras on the training corpus
+"""
+import json
+import sys
+
+import numpy as np
+
+#CONFIGURATION
+WEIGHTS_PATH = 'scam_detector_weights.npz'
+TOKENIZER_JSON_PATH = 'tokenizer.json'
+PARITY_TOLERANCE = 1e-4  # Max |p_numpy - p_keras| accepted by `check`
+LAYERS = ['Embedding', 'Conv1D', 'MaxPooling1D', 'LSTM', 'Dropout', 'Dense']
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class NumpyCnnLstm:
+    """Inference-only copy of the Keras model with the same predict() signature"""
+
+    def __init__(self, weights):
+        self.embedding = weights["embedding"]
+        self.conv_kernel = weights["conv_kernel"]        # (kernel_size, embedding_dim, filters)
+        self.conv_bias = weights["conv_bias"]
+        self.pool_size = int(weights["pool_size"])
+        self.lstm_kernel = weights["lstm_kernel"]        # (filters, 4 * units), gates i, f, c, o
+        self.lstm_recurrent = weights["lstm_recurrent"]  # (units, 4 * units)
+        self.lstm_bias = weights["lstm_bias"]
+        self.dense_kernel = weights["dense_kernel"]      # (units, 1)
+        self.dense_bias = weights["dense_bias"]
+
+    @classmethod
+    def load(cls, path=WEIGHTS_PATH):
+        with np.load(path) as data:
+            return cls({name: data[name].astype(np.float32) if data[name].dtype.kind == 'f' else data[name]
+                        for name in data.files})
+
+    def predict(self, batch, verbose=0):
+        """Scam probabilities, shape (n, 1) like Keras"""
+        x = self.embedding[np.asarray(batch)]                           # (n, T, E)
+
+        # Conv1D (valid padding) as kernel_size shifted matmuls, then ReLU
+        kernel_size = self.conv_kernel.shape[0]
+        steps = x.shape[1] - kernel_size + 1
+        conv = np.broadcast_to(self.conv_bias, (x.shape[0], steps, self.conv_bias.shape[0])).copy()
+        for offset in range(kernel_size):
+            conv += x[:, offset:offset + steps] @ self.conv_kernel[offset]
+        np.maximum(conv, 0, out=conv)
+
+        # MaxPooling1D (valid padding, stride = pool size)
+        pooled_steps = steps // self.pool_size
+        pooled = conv[:, :pooled_steps * self.pool_size].reshape(
+            x.shape[0], pooled_steps, self.pool_size, -1).max(axis=2)
+
+        # LSTM: input projections for every step in one matmul, then the recurrence
+        units = self.lstm_recurrent.shape[0]
+        projected = pooled @ self.lstm_kernel + self.lstm_bias          # (n, S, 4U)
+        h = np.zeros((x.shape[0], units), dtype=np.float32)
+        c = np.zeros_like(h)
+        for t in range(pooled_steps):
+            z = projected[:, t] + h @ self.lstm_recurrent
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units:2 * units])
+            g = np.tanh(z[:, 2 * units:3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+
+        # Dropout is a no-op at inference
+        return _sigmoid(h @ self.dense_kernel + self.dense_bias)
+
+
+class JsonTokenizer:
+    """Keras Tokenizer.texts_to_sequences from an exported word index"""
+
+    def __init__(self, config):
+        self.word_index = config["word_index"]
+        self.num_words = config["num_words"]
+        self.oov_token = config["oov_token"]
+        self.lower = config["lower"]
+        self.split = config["split"]
+        self._translate = str.maketrans({c: self.split for c in config["filters"]})
+
+    @classmethod
+    def load(cls, path=TOKENIZER_JSON_PATH):
+        with open(path, encoding='utf-8') as handle:
+            return cls(json.load(handle))
+
+    def texts_to_sequences(self, texts):
+        oov_index = self.word_index.get(self.oov_token)
+        sequences = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            sequence = []
+            for word in text.translate(self._translate).split(self.split):
+                if not word:
+                    continue
+                index = self.word_index.get(word)
+                if index is not None and not (self.num_words and index >= self.num_words):
+                    sequence.append(index)
+                elif oov_index is not None:
+                    sequence.append(oov_index)
+            sequences.append(sequence)
+        return sequences
+
+
+#EXPORT (needs Keras)
+def export_model(model, tokenizer, weights_path=WEIGHTS_PATH, tokenizer_path=TOKENIZER_JSON_PATH):
+    """Writes a Keras CNN-LSTM's weights to .npz and its tokenizer to JSON"""
+    layers = {layer.__class__.__name__: layer for layer in model.layers}
+    if [layer.__class__.__name__ for layer in model.layers] != LAYERS:
+        raise ValueError(f"Expected layers {LAYERS}, got {[layer.__class__.__name__ for layer in model.layers]}")
+    embedding, = layers['Embedding'].get_weights()
+    conv_kernel, conv_bias = layers['Conv1D'].get_weights()
+    lstm_kernel, lstm_recurrent, lstm_bias = layers['LSTM'].get_weights()
+    dense_kernel, dense_bias = layers['Dense'].get_weights()
+    pool_size = layers['MaxPooling1D'].get_config()['pool_size']
+    np.savez(weights_path, embedding=embedding, conv_kernel=conv_kernel, conv_bias=conv_bias,
+             pool_size=np.int64(pool_size[0] if isinstance(pool_size, (list, tuple)) else pool_size),
+             lstm_kernel=lstm_kernel, lstm_recurrent=lstm_recurrent, lstm_bias=lstm_bias,
+             dense_kernel=dense_kernel, dense_bias=dense_bias)
+    with open(tokenizer_path, 'w', encoding='utf-8') as handle:
+        json.dump({"word_index": tokenizer.word_index, "num_words": tokenizer.num_words,
+                   "oov_token": tokenizer.oov_token, "filters": tokenizer.filters,
+                   "lower": tokenizer.lower, "split": tokenizer.split}, handle)
+
+
+def _load_keras_pair():
+    import pickle
+    import pipeline
+    from keras.models import load_model
+    with open(pipeline.TOKENIZER_PATH, 'rb') as handle:
+        return load_model(pipeline.MODEL_PATH), pickle.load(handle)
+
+
+def check():
+    """Compares tokenization and probabilities with Keras over the corpus"""
+    import csv
+    import pipeline
+    model, tokenizer = _load_keras_pair()
+    engine, json_tokenizer = NumpyCnnLstm.load(), JsonTokenizer.load()
+    with open('call_transcript_cleaned.csv', newline='', encoding='utf-8') as handle:
+        texts = [row['TEXT'] for row in csv.DictReader(handle)]
+
+    sequences = tokenizer.texts_to_sequences(texts)
+    mismatched = sum(a != b for a, b in zip(sequences, json_tokenizer.texts_to_sequences(texts)))
+    batch = np.zeros((len(texts), pipeline.MAX_LENGTH), dtype='int32')
+    for row, sequence in enumerate(sequences):
+        sequence = sequence[:pipeline.MAX_LENGTH]
+        batch[row, :len(sequence)] = sequence
+    difference = np.abs(np.asarray(model.predict(batch, verbose=0)) - engine.predict(batch)).max()
+
+    print(f"Tokenizer: {len(texts) - mismatched}/{len(texts)} sequences identical")
+    print(f"Model: max |p_numpy - p_keras| = {difference:.2e} (tolerance {PARITY_TOLERANCE:.0e})")
+    ok = mismatched == 0 and difference <= PARITY_TOLERANCE
+    print("PARITY OK" if ok else "PARITY FAILED")
+    return 0 if ok else 1
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'export':
+        export_model(*_load_keras_pair())
+        print(f"Exported '{WEIGHTS_PATH}' and '{TOKENIZER_JSON_PATH}'")
+        return 0
+    if command == 'check':
+        return check()
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,473 @@
+"""Shared scam detection pipeline: audio loading, Whisper and the CNN-LSTM.
+
+app.py and the offline tools (batch_score.py) both go through these helpers
+so a call is scored the same way whether it arrives over HTTP or from disk.
+Heavy libraries are imported when a model is loaded, not at import time.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+
+#CONFIGURATION
+MAX_LENGTH = 100
+# Transcripts longer than MAX_LENGTH tokens are scored as overlapping windows
+# (all in the same batched predict) and pooled back into one probability
+WINDOW_STRIDE = 50
+WINDOW_POOLING = 'max'  # 'max' or 'attention' (softmax-weighted by window confidence)
+ATTENTION_TEMPERATURE = 0.1
+# Balanced threshold to reduce false positives but still catch obvious scams
+SCAM_THRESHOLD = 0.7
+SAMPLE_RATE = 16000
+WHISPER_MODEL = "base"
+# Cheaper models for the degraded quality tiers (see quality.py)
+FAST_WHISPER_MODEL = os.environ.get('FAST_WHISPER_MODEL', 'tiny')
+# Whisper's own silence gate (transcribe() defaults): a decode that is probably
+# no speech and not confidently decoded is dropped instead of hallucinated text
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+MODEL_PATH = 'scam_detector_model.h5'
+TOKENIZER_PATH = 'tokenizer.pickle'
+# 'cnn-lstm' (default, Keras), 'numpy' (the same CNN-LSTM run by numpy_engine.py,
+# no TensorFlow) or 'student': the distilled hashed n-gram model from
+# train_model.py (see student_model.py), NumPy only and far cheaper per chunk
+SCAM_DETECTOR = os.environ.get('SCAM_DETECTOR', 'cnn-lstm')
+STUDENT_PATH = 'student_model.npz'
+NUMPY_WEIGHTS_PATH = 'scam_detector_weights.npz'
+TOKENIZER_JSON_PATH = 'tokenizer.json'
+# train_model.py also keeps every trained pair in models/<version>/
+MODELS_DIR = 'models'
+# Written by train_model.py once models/<version>/ and the top-level files are
+# complete; ModelWatcher reloads on it, never on half-written model files
+MODEL_READY_MARKER = os.path.join(MODELS_DIR, 'ready.json')
+# Written by a reload request so every process serving the app (serve_prefork.py
+# workers) follows it, not only the one that received the request
+RELOAD_MARKER = 'reload_request.json'
+# Run through a new model before it takes traffic (graph build, first-call allocations)
+WARMUP_TEXTS = [
+    "Hello, this is your bank. Please confirm your account password immediately.",
+    "Hi, just calling to say dinner is at seven tonight.",
+]
+
+# Strong scam phrases: any hit forces a scam verdict without running the model
+SCAM_KEYWORDS = [
+    "transfer", "bank", "account", "pending transaction", "pay now", "click", "link",
+    "otp", "password", "verification", "refund", "fine", "legal", "warrant",
+    "immediately", "urgent", "your money", "send money", "wire",
+    "social security", "suspend", "irs", "tax debt", "rebate check", "overcharge",
+    "lawsuit settlement", "approval", "settlement", "suspicious activity",
+]
+KEYWORD_CONFIDENCE = 95.0
+# Keyword-only scoring for the 'keywords' quality tier, in the style of
+# detect_scam_keywords: score = min(hits / 5, 1) over these weaker terms
+KEYWORD_ONLY_TERMS = [
+    "money", "pay", "bank", "account", "password", "verify", "confirm",
+    "urgent", "claim", "prize", "winner", "refund", "transfer", "crypto",
+    "update", "click", "link", "confirm identity", "social security",
+]
+KEYWORD_ONLY_THRESHOLD = 0.6
+
+# Calibrated settings written by sweep.py; its scam_threshold replaces the
+# default above when the file exists
+CONFIG_PATH = os.environ.get('SCAM_CONFIG', 'scam_config.json')
+
+
+def load_config(path=CONFIG_PATH):
+    """The sweep.py config as a dict, or None if there is none (or it is unreadable)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as e:
+        print(f"[CONFIG] Ignoring unreadable {path}: {e}")
+        return None
+
+
+config = load_config()
+if config is not None and config.get("scam_threshold") is not None:
+    SCAM_THRESHOLD = float(config["scam_threshold"])
+    print(f"[CONFIG] {CONFIG_PATH} version {config.get('version')}: threshold {SCAM_THRESHOLD:.4f} "
+          f"(target FPR {config.get('target_fpr')})")
+
+#MODELS (loaded on demand)
+stt_model = None
+fast_stt_model = None
+# The CNN-LSTM currently serving. Requests take one reference and keep using
+# it, so a reload swaps this for new requests while in-flight ones finish on
+# the old version.
+active_text_model = None
+# Student model used by the 'fast' quality tier (None: keep the active model)
+fast_text_model = None
+_reload_lock = threading.Lock()
+_marker_seen = None  # mtime of the last RELOAD_MARKER this process has applied
+
+
+class TextModel:
+    """A CNN-LSTM and the tokenizer it was trained with, tagged with a version"""
+
+    def __init__(self, model, tokenizer, version):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.version = version
+        self.loaded_at = time.time()
+
+    def predict_windows(self, texts):
+        """Scores every window of every text in one forward pass.
+
+        Returns (probabilities, windows): the pooled scam probability of each
+        text and, for each text, the window that drove it.
+        """
+        sequences = self.tokenizer.texts_to_sequences(texts)
+        spans = [sliding_windows(len(sequence)) for sequence in sequences]
+
+        # Same layout pad_sequences(padding='post') gives a single window
+        batch = np.zeros((sum(len(text_spans) for text_spans in spans), MAX_LENGTH), dtype='int32')
+        row = 0
+        for sequence, text_spans in zip(sequences, spans):
+            for start, end in text_spans:
+                batch[row, :end - start] = sequence[start:end]
+                row += 1
+        window_probabilities = np.asarray(self.model.predict(batch, verbose=0))[:, 0]
+
+        probabilities = []
+        windows = []
+        row = 0
+        for text_spans in spans:
+            text_probabilities = window_probabilities[row:row + len(text_spans)]
+            row += len(text_spans)
+            probability, driver = pool_windows(text_probabilities)
+            start, end = text_spans[driver]
+            probabilities.append(probability)
+            windows.append({
+                "index": driver,
+                "count": len(text_spans),
+                "start_token": start,
+                "end_token": end,
+                "probability": round(float(text_probabilities[driver]), 4)
+            })
+        return np.asarray(probabilities), windows
+
+    def predict(self, texts):
+        """Returns the scam probability of each text"""
+        return self.predict_windows(texts)[0]
+
+
+def sliding_windows(n_tokens):
+    """(start, end) token spans covering a sequence with MAX_LENGTH windows.
+
+    Short sequences get a single window; long ones get windows every
+    WINDOW_STRIDE tokens, with the last one aligned to the end.
+    """
+    if n_tokens <= MAX_LENGTH:
+        return [(0, n_tokens)]
+    starts = list(range(0, n_tokens - MAX_LENGTH + 1, WINDOW_STRIDE))
+    if starts[-1] != n_tokens - MAX_LENGTH:
+        starts.append(n_tokens - MAX_LENGTH)
+    return [(start, start + MAX_LENGTH) for start in starts]
+
+
+def pool_windows(probabilities):
+    """Combines window probabilities into one; returns (probability, driving window)"""
+    driver = int(np.argmax(probabilities))
+    if WINDOW_POOLING == 'attention' and len(probabilities) > 1:
+        # Confident windows dominate, but several suspicious windows add up
+        weights = np.exp((probabilities - probabilities.max()) / ATTENTION_TEMPERATURE)
+        weights /= weights.sum()
+        return float(np.dot(weights, probabilities)), driver
+    return float(probabilities[driver]), driver
+
+
+def load_stt_model(name=WHISPER_MODEL):
+    """Loads the Whisper speech-to-text model once"""
+    global stt_model
+    if stt_model is None:
+        import whisper
+        import thread_budget
+        thread_budget.configure_torch()
+        stt_model = whisper.load_model(name)
+    return stt_model
+
+
+def file_version(*paths):
+    """Content hash of the model files, used as the version of unversioned models"""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:10]
+
+
+def model_paths(version=None):
+    """Files of the selected detector for a version in MODELS_DIR (None = the top-level files)"""
+    names = {'student': (STUDENT_PATH,),
+             'numpy': (NUMPY_WEIGHTS_PATH, TOKENIZER_JSON_PATH)}.get(SCAM_DETECTOR, (MODEL_PATH, TOKENIZER_PATH))
+    if version is None:
+        return names
+    directory = os.path.join(MODELS_DIR, os.path.basename(version))
+    return tuple(os.path.join(directory, name) for name in names)
+
+
+def build_text_model(version=None, warm_up=True):
+    """Loads (and warms up) a model/tokenizer pair without making it active"""
+    if SCAM_DETECTOR == 'student':
+        from student_model import StudentModel
+        student_path, = model_paths(version)
+        return StudentModel.load(student_path, version or 'student-' + file_version(student_path))
+    model_path, tokenizer_path = model_paths(version)
+    if SCAM_DETECTOR == 'numpy':
+        from numpy_engine import NumpyCnnLstm, JsonTokenizer
+        model = NumpyCnnLstm.load(model_path)
+        tokenizer = JsonTokenizer.load(tokenizer_path)
+    else:
+        from keras.models import load_model
+        model = load_model(model_path)
+        with open(tokenizer_path, 'rb') as handle:
+            tokenizer = pickle.load(handle)
+    text_model = TextModel(model, tokenizer, version or file_version(model_path, tokenizer_path))
+    if warm_up:
+        text_model.predict(WARMUP_TEXTS)
+    return text_model
+
+
+def load_text_model():
+    """Loads the selected detector (CNN-LSTM + tokenizer, or the student) once (raises if missing)"""
+    global active_text_model, _marker_seen
+    if active_text_model is None:
+        # No warm-up here: serve_prefork.py must not run TensorFlow before forking
+        active_text_model = build_text_model(warm_up=False)
+        # A reload requested before this start-up is not replayed
+        if os.path.exists(RELOAD_MARKER):
+            _marker_seen = os.path.getmtime(RELOAD_MARKER)
+    return active_text_model
+
+
+def reload_text_model(version=None, broadcast=False):
+    """Loads and warms a new model pair, then swaps it in for new requests.
+
+    Returns (new version, previous version, seconds spent loading). Raises if
+    the new pair fails to load, in which case the current model keeps serving.
+    With broadcast, also writes RELOAD_MARKER so the other processes' watchers
+    load the same version.
+    """
+    global active_text_model, _marker_seen
+    with _reload_lock:
+        started = time.time()
+        text_model = build_text_model(version)
+        previous = active_text_model
+        active_text_model = text_model  # Single reference assignment: atomic for readers
+        if broadcast:
+            temporary = f"{RELOAD_MARKER}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as handle:
+                json.dump({"version": version, "requested_at": time.time()}, handle)
+            os.replace(temporary, RELOAD_MARKER)
+            _marker_seen = os.path.getmtime(RELOAD_MARKER)
+        return text_model.version, previous.version if previous else None, round(time.time() - started, 2)
+
+
+def list_model_versions():
+    """Versions available in MODELS_DIR, oldest first"""
+    if not os.path.isdir(MODELS_DIR):
+        return []
+    return sorted(name for name in os.listdir(MODELS_DIR)
+                  if os.path.exists(model_paths(name)[0]))
+
+
+class ModelWatcher:
+    """Reloads the text model when train_model.py finishes a new version
+    (MODEL_READY_MARKER), and follows reloads requested in another process
+    (RELOAD_MARKER).
+
+    train_model.py writes the marker last, so the watcher never loads a new
+    tokenizer next to the old model; it loads the version named in the marker
+    from its models/<version>/ directory.
+
+    The polling thread is started per process by ensure_running(), so each
+    pre-forked worker runs its own; the marker stamp seen before the fork is
+    inherited, so a worker still catches versions finished since.
+    """
+
+    def __init__(self, interval=10, watch_files=True):
+        self.interval = interval
+        self.watch_files = watch_files
+        self.last_seen = self._stamp()
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def ensure_running(self):
+        if self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, daemon=True, name='model-watcher')
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    @staticmethod
+    def _stamp():
+        try:
+            return os.path.getmtime(MODEL_READY_MARKER)
+        except OSError:
+            return None
+
+    def _follow_marker(self):
+        global _marker_seen
+        try:
+            stamp = os.path.getmtime(RELOAD_MARKER)
+            if stamp == _marker_seen:
+                return
+            with open(RELOAD_MARKER) as handle:
+                version = json.load(handle).get("version")
+        except (OSError, ValueError):
+            return
+        _marker_seen = stamp
+        try:
+            new_version, previous, seconds = reload_text_model(version)
+            print(f"[MODEL] Followed reload request: {previous} -> {new_version} in {seconds}s")
+        except Exception as e:
+            print(f"[MODEL] Requested reload failed, keeping {active_text_model.version}: {e}")
+
+    def _follow_training(self):
+        stamp = self._stamp()
+        if stamp is None or stamp == self.last_seen:
+            return
+        try:
+            with open(MODEL_READY_MARKER) as handle:
+                version = json.load(handle).get("version")
+        except (OSError, ValueError):
+            return
+        self.last_seen = stamp
+        try:
+            new_version, previous, seconds = reload_text_model(version)
+            print(f"[MODEL] Reloaded {previous} -> {new_version} in {seconds}s")
+        except Exception as e:
+            print(f"[MODEL] Reload failed, keeping {active_text_model.version}: {e}")
+
+    def run(self):
+        while True:
+            self._follow_marker()
+            if self.watch_files:
+                self._follow_training()
+            time.sleep(self.interval)
+
+
+def load_audio(path):
+    """Loads any librosa-supported file as 16 kHz mono float32 in [-1, 1]"""
+    import librosa
+    audio_data, _ = librosa.load(path, sr=SAMPLE_RATE)
+    return audio_data
+
+
+def transcribe(audio, model=None, **options):
+    """Runs Whisper (stt_model unless another is given) and returns the stripped text"""
+    options.setdefault('language', 'en')
+    result = (model or stt_model).transcribe(audio, **options)
+    return result.get("text", "").strip()
+
+
+def decoded_text(result):
+    """Stripped text of a whisper.decode() result, empty when Whisper's no-speech gate rejects it"""
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+        return ""
+    return result.text.strip()
+
+
+def keyword_hits(text_transcript):
+    """Returns the strong scam keywords found in the text"""
+    cleaned_text = text_transcript.lower()
+    return [kw for kw in SCAM_KEYWORDS if kw in cleaned_text]
+
+
+def _verdict(prediction):
+    """Turns a model probability into (is_scam, confidence %)"""
+    is_scam = bool(prediction > SCAM_THRESHOLD)
+    confidence_score = round(float(prediction) * 100, 2)
+
+    if not is_scam:
+        confidence_score = round((1 - float(prediction)) * 100, 2)
+
+    return is_scam, confidence_score
+
+
+def analyze_texts(text_transcripts, text_model=None):
+    """Scores many transcripts with a single model call.
+
+    Empty texts get no verdict, keyword hits short-circuit to a scam verdict,
+    and everything else goes through the CNN-LSTM in one batched predict.
+    Each result is a dict with is_scam, confidence, model_version and the
+    token window that drove the model's verdict (None if the model did not run).
+    """
+    text_model = text_model or active_text_model  # One version for the whole batch
+    results = [None] * len(text_transcripts)
+    windows = [None] * len(text_transcripts)
+    model_indices = []
+    model_texts = []
+
+    for i, text_transcript in enumerate(text_transcripts):
+        if not text_transcript or len(text_transcript.strip()) == 0:
+            results[i] = (None, None)
+        elif keyword_hits(text_transcript):
+            # If strong scam keywords appear, force scam with high confidence
+            results[i] = (True, KEYWORD_CONFIDENCE)
+        else:
+            model_indices.append(i)
+            model_texts.append(text_transcript)
+
+    if model_texts:
+        predictions, model_windows = text_model.predict_windows(model_texts)
+        for i, prediction, window in zip(model_indices, predictions, model_windows):
+            results[i] = _verdict(prediction)
+            windows[i] = window
+
+    return [{"is_scam": is_scam, "confidence": confidence_score, "model_version": text_model.version,
+             "window": window}
+            for (is_scam, confidence_score), window in zip(results, windows)]
+
+
+def analyze_keywords(text_transcripts):
+    """Keyword-only verdicts (no model), same result format as analyze_texts"""
+    results = []
+    for text_transcript in text_transcripts:
+        if not text_transcript or len(text_transcript.strip()) == 0:
+            is_scam, confidence_score = None, None
+        elif keyword_hits(text_transcript):
+            is_scam, confidence_score = True, KEYWORD_CONFIDENCE
+        else:
+            cleaned_text = text_transcript.lower()
+            prediction = min(sum(1 for term in KEYWORD_ONLY_TERMS if term in cleaned_text) / 5, 1.0)
+            is_scam = bool(prediction > KEYWORD_ONLY_THRESHOLD)
+            confidence_score = round(prediction * 100, 2) if is_scam else round((1 - prediction) * 100, 2)
+        results.append({"is_scam": is_scam, "confidence": confidence_score, "model_version": "keywords",
+                        "window": None})
+    return results
+
+
+def load_fast_models():
+    """Loads the degraded-tier models: small Whisper and, if trained, the student"""
+    global fast_stt_model, fast_text_model
+    if fast_stt_model is None and stt_model is not None:
+        import whisper
+        fast_stt_model = whisper.load_model(FAST_WHISPER_MODEL)
+    if fast_text_model is None and SCAM_DETECTOR != 'student' and os.path.exists(STUDENT_PATH):
+        from student_model import StudentModel
+        fast_text_model = StudentModel.load(STUDENT_PATH, 'student-' + file_version(STUDENT_PATH))
+
+
+def analyze_text(text_transcript, text_model=None):
+    """Scores one transcript (see analyze_texts)"""
+    return analyze_texts([text_transcript], text_model)[0]
+
+
+def detect_scam_batch(text_transcripts):
+    """Scores many transcripts and returns (is_scam, confidence) pairs"""
+    return [(result["is_scam"], result["confidence"]) for result in analyze_texts(text_transcripts)]
+
+
+def detect_scam(text_transcript):
+    """Analyzes text and returns scam prediction"""
+    return detect_scam_batch([text_transcript])[0]
@@ -0,0 +1,276 @@
+"""Opt-in profiling for the Flask app, installed only when PROFILING_ENABLED is set.
+
+With profiling off, install() is never called: no hooks or routes are
+registered and requests pay nothing.
+
+With profiling on, two kinds of profile are available:
+
+* Per-request traces: a request sent by an admin with the header
+  ``X-Profile: 1``, or picked at random with probability PROFILE_SAMPLE_RATE,
+  is traced deterministically. Python calls on the request thread are recorded with
+  sys.setprofile down to MAX_TRACE_DEPTH, and C calls down to
+  MAX_C_CALL_DEPTH, so the hot inner loops of Whisper and TensorFlow do not
+  produce millions of events. After MAX_TRACE_EVENTS events the trace stops
+  and is saved marked as truncated. The trace is written as a speedscope
+  "evented" profile (open it at https://www.speedscope.app). Its file name
+  is returned in the X-Profile-Id response header. A streamed response
+  (progressive /predict) is traced until its body has been sent.
+* Whole-process sampling: ``POST /admin/profile?seconds=N`` samples the
+  stack of every thread for N seconds. It writes collapsed stacks, which
+  flamegraph.pl and speedscope can both read. With INFERENCE_WORKERS the
+  Whisper worker processes are sampled too, under "inference-worker-<n>".
+
+A request trace only sees its own thread. Work handed to other threads or
+processes, such as the STT batcher thread and the inference workers, shows up
+in the trace as waiting; profile it with the process sampler.
+
+Files are listed at GET /admin/profiles and downloaded from
+GET /admin/profiles/<name>. Only the newest MAX_PROFILES files are kept.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import request, jsonify, send_from_directory, g
+
+MAX_PROFILES = 50
+# Bounds on one request trace (memory and file size stay in the tens of MB)
+MAX_TRACE_EVENTS = 200000
+MAX_TRACE_DEPTH = 60
+MAX_C_CALL_DEPTH = 30
+
+
+#PER-REQUEST TRACING
+class RequestTracer:
+    """Deterministic call tracer for one thread, exported in speedscope's evented format"""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = []
+        self.frame_index = {}
+        self.events = []
+        self.stack = []  # Frame index per open call, None for calls deeper than the limits
+        self.started = None
+        self.truncated = False
+
+    def _frame(self, key, name, file, line):
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({"name": name, "file": file, "line": line})
+        return index
+
+    def _trace(self, frame, event, arg):
+        if event == 'call' or event == 'c_call':
+            depth = len(self.stack)
+            if depth >= (MAX_TRACE_DEPTH if event == 'call' else MAX_C_CALL_DEPTH):
+                self.stack.append(None)  # Counted for matching returns, not recorded
+                return
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                self.truncated = True
+                sys.setprofile(None)  # stop() closes the calls still open
+                return
+            if event == 'call':
+                code = frame.f_code
+                index = self._frame(code, code.co_name, code.co_filename, code.co_firstlineno)
+            else:
+                module = getattr(arg, '__module__', None) or 'builtins'
+                name = getattr(arg, '__qualname__', None) or getattr(arg, '__name__', repr(arg))
+                index = self._frame(('c', module, name), f"{module}.{name}", module, 0)
+            self.stack.append(index)
+            self.events.append({"type": "O", "frame": index, "at": (time.perf_counter() - self.started) * 1000})
+            return
+        # 'return', 'c_return', 'c_exception': frames entered before tracing started are ignored
+        if self.stack:
+            index = self.stack.pop()
+            if index is not None:
+                self.events.append({"type": "C", "frame": index, "at": (time.perf_counter() - self.started) * 1000})
+
+    def start(self):
+        self.started = time.perf_counter()
+        sys.setprofile(self._trace)
+
+    def stop(self):
+        sys.setprofile(None)
+        end = (time.perf_counter() - self.started) * 1000
+        while self.stack:
+            index = self.stack.pop()
+            if index is not None:
+                self.events.append({"type": "C", "frame": index, "at": end})
+        return end
+
+    def speedscope(self, end):
+        name = self.name + (f" (truncated at {MAX_TRACE_EVENTS} events)" if self.truncated else "")
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "scam-detector profiling.py",
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "evented",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": end,
+                "events": self.events
+            }]
+        }
+
+
+#WHOLE-PROCESS SAMPLING
+def sample_process(seconds, interval):
+    """Samples every thread's stack; returns Counter of collapsed stacks"""
+    me = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if len(names) != threading.active_count():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            parts.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(parts))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class Profiler:
+    """Stores profiles on disk and wires the hooks/routes into the app"""
+
+    def __init__(self, output_dir='profiles', sample_rate=0.0, allowed=None, sample_workers=None):
+        self.output_dir = os.path.abspath(output_dir)
+        self.allowed = allowed
+        self.sample_workers = sample_workers  # (seconds, interval) -> {label: Counter} of other processes
+        self.sample_rate = sample_rate
+        self.sampling = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _save(self, name, content):
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        # Keep disk use bounded
+        files = sorted(self.list(), key=lambda entry: entry["created_at"])
+        for old in files[:-MAX_PROFILES]:
+            os.remove(os.path.join(self.output_dir, old["name"]))
+        return name
+
+    def list(self):
+        entries = []
+        for name in os.listdir(self.output_dir):
+            stat = os.stat(os.path.join(self.output_dir, name))
+            entries.append({"name": name, "bytes": stat.st_size, "created_at": stat.st_mtime})
+        return entries
+
+    #Hooks
+    def before_request(self):
+        # Traces are expensive, so only admins may ask for one
+        wanted = request.headers.get('X-Profile') == '1' and (self.allowed is None or self.allowed())
+        if not wanted and self.sample_rate and not request.path.startswith('/admin'):
+            wanted = random.random() < self.sample_rate
+        if wanted:
+            g.tracer = RequestTracer(f"{request.method} {request.path}")
+            g.tracer.start()
+
+    def after_request(self, response):
+        tracer = g.pop('tracer', None)
+        if tracer is not None:
+            endpoint = request.path.strip('/').replace('/', '_') or 'root'
+            name = f"request_{endpoint}_{int(time.time() * 1000)}_{os.getpid()}.speedscope.json"
+            response.headers['X-Profile-Id'] = name
+            if response.is_streamed:
+                # The body (transcription, scoring) runs after this hook: trace until it is sent
+                response.call_on_close(lambda: self._finish(tracer, name))
+            else:
+                self._finish(tracer, name)
+        return response
+
+    def _finish(self, tracer, name):
+        end = tracer.stop()
+        self._save(name, json.dumps(tracer.speedscope(end)))
+        print(f"[PROFILE] {tracer.name}: {end:.1f} ms traced, {len(tracer.events)} events"
+              f"{' (truncated)' if tracer.truncated else ''} -> {name}")
+
+    def teardown_request(self, exc):
+        # Make sure the tracer is off even if the request failed before after_request
+        if g.get('tracer') is not None:
+            g.pop('tracer').stop()
+
+    def start_sampling(self, seconds, interval):
+        """Samples the process in a background thread; returns the output file name"""
+        if not self.sampling.acquire(blocking=False):
+            return None
+        name = f"process_{int(time.time() * 1000)}_{os.getpid()}_{seconds}s.collapsed.txt"
+
+        def run():
+            try:
+                workers = {}
+                if self.sample_workers is not None:
+                    sampler = threading.Thread(target=lambda: workers.update(self.sample_workers(seconds, interval)),
+                                               daemon=True, name='profile-worker-sampler')
+                    sampler.start()
+                stacks = sample_process(seconds, interval)
+                if self.sample_workers is not None:
+                    sampler.join()
+                for label, worker_stacks in workers.items():
+                    for stack, count in worker_stacks.items():
+                        stacks[f"{label};{stack}"] += count
+                self._save(name, "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+                print(f"[PROFILE] Process sample ({seconds}s, {sum(stacks.values())} samples) -> {name}")
+            finally:
+                self.sampling.release()
+
+        threading.Thread(target=run, daemon=True, name='profile-sampler').start()
+        return name
+
+
+def install(app, allowed, output_dir='profiles', sample_rate=0.0, sample_workers=None):
+    """Registers profiling hooks and admin routes; allowed() guards the admin routes.
+
+    sample_workers(seconds, interval), if given, samples other processes
+    (InferencePool.sample) alongside this one.
+    """
+    profiler = Profiler(output_dir, sample_rate, allowed, sample_workers)
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+
+    def start_profile():
+        if not allowed():
+            return jsonify({'error': 'Forbidden'}), 403
+        try:
+            seconds = min(float(request.args.get('seconds', 10)), 300)
+            interval = max(float(request.args.get('interval_ms', 5)), 1) / 1000
+        except ValueError:
+            return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+        name = profiler.start_sampling(seconds, interval)
+        if name is None:
+            return jsonify({'error': 'A process profile is already running'}), 409
+        return jsonify({"profile": name, "ready_in_seconds": seconds}), 202
+
+    def list_profiles():
+        if not allowed():
+            return jsonify({'error': 'Forbidden'}), 403
+        return jsonify({"profiles": sorted(profiler.list(), key=lambda entry: -entry["created_at"])})
+
+    def get_profile(name):
+        if not allowed():
+            return jsonify({'error': 'Forbidden'}), 403
+        return send_from_directory(profiler.output_dir, name, as_attachment=True)
+
+    app.add_url_rule('/admin/profile', 'start_profile', start_profile, methods=['POST'])
+    app.add_url_rule('/admin/profiles', 'list_profiles', list_profiles, methods=['GET'])
+    app.add_url_rule('/admin/profiles/<path:name>', 'get_profile', get_profile, methods=['GET'])
+    print(f"[PROFILE] Profiling enabled (sample rate {sample_rate}, output {profiler.output_dir})")
+    return profiler
@@ -0,0 +1,158 @@
+"""Load-aware quality tiers that protect live-call latency.
+
+Under saturation every request would keep taking the most expensive path
+(Whisper base with temperature fallback, then the full text model), and latency
+collapses for everyone. The controller compares live-call latency with an SLO
+and moves between tiers:
+
+    full      Whisper transcribe() with temperature fallback + the configured detector
+    greedy    single greedy decode (temperature 0, no fallback, no prompt conditioning)
+    fast      greedy on the small Whisper model (FAST_WHISPER_MODEL) + the student model
+    keywords  fast transcription + keyword-only scoring (no text model at all)
+
+Only /stream chunks (a few seconds of audio each) are timed as whole requests.
+A whole-file /predict takes as long as its recording, so it would push the p95
+past any live-call SLO without the server being overloaded. Stages are timed
+too, each against its share of the SLO (STAGE_BUDGETS): Whisper and scoring on
+/stream and /detect, and queue wait (request limiter, STT batcher, inference
+pool slot) on every endpoint. Pressure is the worst of request p95 / SLO and
+stage p95 / stage budget.
+
+The controller steps down one tier when pressure goes above 1. It steps back
+up once pressure has stayed below recover_ratio for recover_after seconds.
+The gap between the two thresholds and the cooldown keep it from flapping.
+Each request reads the tier once at the start and reports it as quality_tier.
+"""
+import threading
+import time
+from collections import deque
+
+TIERS = ('full', 'greedy', 'fast', 'keywords')
+# Share of the SLO each stage may take at p95 before it alone triggers a step down
+STAGE_BUDGETS = {"queue": 0.25, "stt": 0.8, "scoring": 0.2}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class QualityController:
+    """Picks the quality tier from recent live-call and stage latencies"""
+
+    def __init__(self, slo_ms, horizon=30.0, min_samples=10, cooldown=5.0,
+                 recover_after=15.0, recover_ratio=0.6, max_tier=len(TIERS) - 1,
+                 stage_budgets=STAGE_BUDGETS):
+        self.slo = slo_ms / 1000
+        self.horizon = horizon
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.recover_after = recover_after
+        self.recover_ratio = recover_ratio
+        self.max_tier = max_tier
+        self.stage_budgets = {stage: share * self.slo for stage, share in stage_budgets.items()}
+        self.level = 0
+        self.changed_at = time.time()
+        self.calm_since = None
+        self.samples = deque()  # (timestamp, seconds) of timed requests
+        self.stages = {}        # stage -> deque of (timestamp, seconds)
+        self.served = {tier: 0 for tier in TIERS}
+        self.history = deque(maxlen=20)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def tier(self):
+        """Tier for a new request (also steps up if traffic has stopped)"""
+        with self.lock:
+            self._adjust(time.time())
+            return TIERS[self.level]
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self, tier, seconds=None):
+        """Ends a request; seconds (None: not timed) is its latency against the SLO"""
+        now = time.time()
+        with self.lock:
+            self.in_flight -= 1
+            self.served[tier] += 1
+            if seconds is not None:
+                self.samples.append((now, seconds))
+            self._adjust(now)
+
+    def observe_stage(self, stage, seconds):
+        """Records one stage (queue, stt, scoring); stages with a budget count towards pressure"""
+        with self.lock:
+            self.stages.setdefault(stage, deque()).append((time.time(), seconds))
+
+    def _p95(self, samples, now):
+        while samples and samples[0][0] < now - self.horizon:
+            samples.popleft()
+        if len(samples) < self.min_samples:
+            return None
+        return _percentile([seconds for _, seconds in samples], 0.95)
+
+    def _pressure(self, now):
+        """Worst p95 / budget over the request and its stages, and what caused it (None: no data)"""
+        worst = None
+        p95 = self._p95(self.samples, now)
+        if p95 is not None:
+            worst = (p95 / self.slo, "request", p95)
+        for stage, samples in self.stages.items():
+            stage_p95 = self._p95(samples, now)
+            budget = self.stage_budgets.get(stage)
+            if stage_p95 is not None and budget and (worst is None or stage_p95 / budget > worst[0]):
+                worst = (stage_p95 / budget, stage, stage_p95)
+        return worst
+
+    def _adjust(self, now):
+        worst = self._pressure(now)
+        since_change = now - self.changed_at
+        if worst is not None and worst[0] > 1:
+            self.calm_since = None
+            if self.level < self.max_tier and since_change >= self.cooldown:
+                self._move(+1, now, worst)
+            return
+        # No recent traffic counts as calm
+        if worst is None or worst[0] < self.recover_ratio:
+            self.calm_since = self.calm_since or now
+            if (self.level > 0 and now - self.calm_since >= self.recover_after
+                    and since_change >= self.recover_after):
+                self._move(-1, now, worst)
+        else:
+            self.calm_since = None
+
+    def _move(self, step, now, worst):
+        previous = TIERS[self.level]
+        self.level += step
+        self.changed_at = now
+        self.calm_since = None
+        # Judge the new tier on its own latencies
+        self.samples.clear()
+        for samples in self.stages.values():
+            samples.clear()
+        cause = f"{worst[1]} p95 {worst[2] * 1000:.0f} ms" if worst is not None else "no traffic"
+        self.history.append({"at": round(now, 3), "from": previous, "to": TIERS[self.level], "cause": cause})
+        print(f"[QUALITY] {previous} -> {TIERS[self.level]} ({cause}, SLO {self.slo * 1000:.0f} ms)")
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            p95 = self._p95(self.samples, now)
+            stages = {}
+            for stage, samples in self.stages.items():
+                stage_p95 = self._p95(samples, now)
+                stages[stage] = round(stage_p95 * 1000, 1) if stage_p95 is not None else None
+            worst = self._pressure(now)
+            return {
+                "tier": TIERS[self.level],
+                "slo_ms": round(self.slo * 1000),
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "stage_p95_ms": stages,
+                "stage_budget_ms": {stage: round(budget * 1000) for stage, budget in self.stage_budgets.items()},
+                "pressure": round(worst[0], 2) if worst is not None else None,
+                "in_flight": self.in_flight,
+                "served": dict(self.served),
+                "changes": list(self.history)
+            }
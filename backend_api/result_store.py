@@ -0,0 +1,289 @@
+"""Server-side store of scam verdicts for the history and statistics views.
+
+Results go into an SQLite database in WAL mode. Requests only put a row on
+an in-memory queue. A background writer inserts rows in batches and, in the
+same transaction, updates aggregate tables (per-day counts, confidence
+histogram) for the user and for the whole fleet (user_id '*'). /stats reads
+the aggregates, so its cost depends on the number of days asked for, not on
+the number of stored results. /history is an indexed range scan.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+FLEET = '*'
+HISTOGRAM_BUCKETS = 10  # Confidence buckets of 10 percentage points
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    endpoint TEXT NOT NULL,
+    is_scam INTEGER NOT NULL,
+    confidence REAL,
+    model_version TEXT,
+    transcript TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_user_time ON results (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_results_time ON results (created_at);
+CREATE INDEX IF NOT EXISTS idx_results_verdict_time ON results (is_scam, created_at);
+
+CREATE TABLE IF NOT EXISTS daily_stats (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    scams INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS confidence_histogram (
+    user_id TEXT NOT NULL,
+    is_scam INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, is_scam, bucket)
+);
+"""
+
+
+def _day(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def _bucket(confidence):
+    return min(int((confidence or 0) // (100 / HISTOGRAM_BUCKETS)), HISTOGRAM_BUCKETS - 1)
+
+
+class ResultStore:
+    """Batched, off-request-path writer plus fast history/stats queries"""
+
+    def __init__(self, path='scam_results.db', batch_size=500, flush_interval=0.5, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self._local = threading.local()
+        self._writer = None
+        self._writer_pid = None
+        self._start_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, far fewer fsyncs
+        return connection
+
+    def _reader(self):
+        """One read connection per thread (WAL readers never block the writer)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return connection
+
+    #WRITING
+    def record(self, user_id, endpoint, is_scam, confidence, model_version=None, transcript=None):
+        """Queues a verdict for storage; never blocks the request"""
+        if is_scam is None:
+            return
+        self._ensure_writer()
+        try:
+            self.pending.put_nowait((user_id or 'anonymous', time.time(), endpoint, int(bool(is_scam)),
+                                     confidence, model_version, transcript))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        # Started lazily so each pre-forked worker gets its own writer thread
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._start_lock:
+            if self._writer_pid != os.getpid() or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(connection, batch)
+            except sqlite3.Error as e:
+                print(f"[STORE] Failed to write {len(batch)} results: {e}")
+            for _ in batch:
+                self.pending.task_done()
+
+    def _write_batch(self, connection, batch):
+        daily = Counter()
+        confidence_sums = Counter()
+        scams = Counter()
+        histogram = Counter()
+        for user_id, created_at, _, is_scam, confidence, _, _ in batch:
+            for owner in (user_id, FLEET):
+                key = (owner, _day(created_at))
+                daily[key] += 1
+                scams[key] += is_scam
+                confidence_sums[key] += confidence or 0
+                histogram[(owner, is_scam, _bucket(confidence))] += 1
+
+        with connection:
+            connection.executemany(
+                "INSERT INTO results (user_id, created_at, endpoint, is_scam, confidence, model_version, transcript) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            connection.executemany(
+                "INSERT INTO daily_stats (user_id, day, total, scams, confidence_sum) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, day) DO UPDATE SET total = total + excluded.total, "
+                "scams = scams + excluded.scams, confidence_sum = confidence_sum + excluded.confidence_sum",
+                [(owner, day, count, scams[(owner, day)], confidence_sums[(owner, day)])
+                 for (owner, day), count in daily.items()])
+            connection.executemany(
+                "INSERT INTO confidence_histogram (user_id, is_scam, bucket, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, is_scam, bucket) DO UPDATE SET count = count + excluded.count",
+                [(owner, is_scam, bucket, count) for (owner, is_scam, bucket), count in histogram.items()])
+        self.written += len(batch)
+
+    def flush(self, timeout=5):
+        """Waits (up to timeout seconds) for queued results to be written"""
+        deadline = time.time() + timeout
+        while self.pending.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    #READING
+    def history(self, user_id=None, limit=50, before=None, is_scam=None):
+        """Newest results first; pass the last created_at as before= for the next page"""
+        clauses, params = [], []
+        if user_id:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if is_scam is not None:
+            clauses.append("is_scam = ?")
+            params.append(int(is_scam))
+        if before is not None:
+            clauses.append("created_at < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            "SELECT id, user_id, created_at, endpoint, is_scam, confidence, model_version, transcript "
+            f"FROM results {where} ORDER BY created_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [{
+            "id": row[0], "user_id": row[1], "created_at": row[2], "endpoint": row[3],
+            "is_scam": bool(row[4]), "confidence": row[5], "model_version": row[6], "transcript": row[7]
+        } for row in rows]
+
+    def stats(self, user_id=None, days=30):
+        """Totals, scam rate by day and confidence histogram from the aggregate tables"""
+        owner = user_id or FLEET
+        connection = self._reader()
+        since = _day(time.time() - (days - 1) * 86400)
+        daily_rows = connection.execute(
+            "SELECT day, total, scams, confidence_sum FROM daily_stats "
+            "WHERE user_id = ? AND day >= ? ORDER BY day", (owner, since)).fetchall()
+        all_time = connection.execute(
+            "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(scams), 0) FROM daily_stats WHERE user_id = ?",
+            (owner,)).fetchone()
+        histogram_rows = connection.execute(
+            "SELECT is_scam, bucket, count FROM confidence_histogram WHERE user_id = ?", (owner,)).fetchall()
+
+        histogram = {"scam": [0] * HISTOGRAM_BUCKETS, "safe": [0] * HISTOGRAM_BUCKETS}
+        for is_scam, bucket, count in histogram_rows:
+            histogram["scam" if is_scam else "safe"][bucket] = count
+
+        total, scam_total = all_time
+        return {
+            "user_id": user_id,
+            "total": total,
+            "scams": scam_total,
+            "safe": total - scam_total,
+            "scam_rate": round(scam_total / total, 4) if total else None,
+            "daily": [{
+                "day": day, "total": day_total, "scams": day_scams,
+                "scam_rate": round(day_scams / day_total, 4),
+                "avg_confidence": round(confidence_sum / day_total, 2)
+            } for day, day_total, day_scams, confidence_sum in daily_rows],
+            "confidence_histogram": {
+                "bucket_width": 100 // HISTOGRAM_BUCKETS,
+                **histogram
+            },
+            "pending_writes": self.pending.qsize(),
+            "dropped_writes": self.dropped
+        }
+
+
+def _worse(current, verdict):
+    """The verdict that should represent the call: scams beat safe chunks, then higher confidence"""
+    if current is None:
+        return verdict
+    if verdict["is_scam"] != current["is_scam"]:
+        return verdict if verdict["is_scam"] else current
+    if verdict["is_scam"]:
+        return verdict if (verdict["confidence"] or 0) > (current["confidence"] or 0) else current
+    return verdict  # Safe so far: keep the latest
+
+
+class CallVerdicts:
+    """Worst chunk verdict of each live /stream call, so a call is stored once as a whole.
+
+    Keyed by session_id, call_id, or user and client address for clients that
+    send neither (chunk 0 then starts a new call). Calls that never send
+    is_final are handed back once they have been idle for ttl seconds.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.calls = {}  # key -> {"user_id", "verdict", "transcripts", "last_seen"}
+        self.lock = threading.Lock()
+
+    def add(self, key, user_id, verdict, transcript, new_call=False):
+        """Adds one chunk; returns calls that are over (restarted or idle) as (user_id, verdict, transcript)"""
+        now = time.time()
+        with self.lock:
+            finished = self._expire(now)
+            call = self.calls.get(key)
+            if call is not None and new_call:
+                finished.append(self._result(self.calls.pop(key)))
+                call = None
+            if call is None:
+                call = self.calls[key] = {"user_id": user_id, "verdict": None, "transcripts": []}
+            call["last_seen"] = now
+            if verdict["is_scam"] is not None:
+                call["verdict"] = _worse(call["verdict"], verdict)
+            if transcript:
+                call["transcripts"].append(transcript)
+        return [result for result in finished if result is not None]
+
+    def finish(self, key):
+        """Ends a call; returns its (user_id, verdict, transcript), or None if no chunk had speech"""
+        with self.lock:
+            call = self.calls.pop(key, None)
+        return self._result(call) if call is not None else None
+
+    def _expire(self, now):
+        stale = [key for key, call in self.calls.items() if now - call["last_seen"] > self.ttl]
+        return [self._result(self.calls.pop(key)) for key in stale]
+
+    @staticmethod
+    def _result(call):
+        if call["verdict"] is None:
+            return None
+        return call["user_id"], call["verdict"], " ".join(call["transcripts"])
+
+    def __len__(self):
+        with self.lock:
+            return len(self.calls)
@@ -0,0 +1,373 @@
+"""Session-affinity router for running several app.py replicas.
+
+/stream with a session_id keeps per-call state (the log-mel buffer) in the
+replica that served the first chunk, so every chunk of a call must reach that
+replica. The router places session ids on a consistent-hash ring with virtual
+nodes. Each replica owns many small arcs of the ring, so adding or removing
+one moves only the sessions on its arcs (about 1/N of them).
+
+When a replica joins, sessions whose arcs it takes over are exported from
+their old owner and imported into it. When a replica drains, all of its
+sessions are handed to their new owners before it is dropped. A replica that
+stops answering health checks is removed without handoff (its calls restart
+their window on the next replica). Requests without a session id go to the
+replica with the fewest requests in flight.
+
+Try it on one machine:
+    python app.py --port 5001 & python app.py --port 5002 &
+    python router.py --port 5000 --backend http://127.0.0.1:5001 --backend http://127.0.0.1:5002
+    curl -X POST localhost:5000/router/backends -H "Content-Type: application/json" \\
+         -d '{"url": "http://127.0.0.1:5003"}'                      # join
+    curl -X DELETE "localhost:5000/router/backends?url=http://127.0.0.1:5001"   # drain
+    curl localhost:5000/router/stats                                 # per-shard load
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+
+#CONFIGURATION
+VIRTUAL_NODES = 100
+HEALTH_CHECK_INTERVAL = 5  # Seconds between /health probes of every backend
+PROXY_TIMEOUT = 300
+SESSION_TTL = 300  # Forget a session this long after its last chunk (matches STREAM_SESSION_TTL)
+# Forwarded to the replicas' admin endpoints; also required by the router's own admin routes if set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Admin/profiling headers are not forwarded: the replicas' admin endpoints are
+# not reachable through the router (see proxy)
+FORWARD_HEADERS = ('Content-Type', 'Accept', 'X-User-Id', 'X-Session-Id')
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes"""
+
+    def __init__(self, vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.points = []   # Sorted hashes
+        self.owners = []   # Backend owning the arc ending at points[i]
+
+    def add(self, backend):
+        for i in range(self.vnodes):
+            point = _hash(f"{backend}#{i}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, backend)
+
+    def remove(self, backend):
+        keep = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != backend]
+        self.points = [point for point, _ in keep]
+        self.owners = [owner for _, owner in keep]
+
+    def lookup(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def shares(self):
+        """Fraction of the hash space owned by each backend"""
+        shares = {}
+        for i, owner in enumerate(self.owners):
+            arc = (self.points[i] - self.points[i - 1]) % (1 << 64) if len(self.points) > 1 else 1 << 64
+            shares[owner] = shares.get(owner, 0) + arc / (1 << 64)
+        return shares
+
+
+class Router:
+    """Backend membership, session placement, handoff and per-shard counters"""
+
+    def __init__(self, backends, vnodes=VIRTUAL_NODES):
+        self.ring = HashRing(vnodes)
+        self.lock = threading.RLock()
+        self.stats = {}
+        self.sessions = {}        # session id -> last chunk time
+        self.pinned = {}          # session id -> backend still holding it during a handoff
+        self.session_locks = {}   # Chunks of one call (and its handoff) run one at a time
+        for backend in backends:
+            self._add(backend)
+
+    def _add(self, backend):
+        self.ring.add(backend)
+        self.stats[backend] = {"requests": 0, "in_flight": 0, "errors": 0, "total_ms": 0.0, "healthy": True}
+
+    def backends(self):
+        with self.lock:
+            return list(self.stats)
+
+    def session_lock(self, session_id):
+        with self.lock:
+            return self.session_locks.setdefault(session_id, threading.Lock())
+
+    def owner(self, session_id):
+        with self.lock:
+            self.sessions[session_id] = time.time()
+            return self.pinned.get(session_id) or self.ring.lookup(session_id)
+
+    def least_loaded(self):
+        with self.lock:
+            healthy = [backend for backend, stats in self.stats.items() if stats["healthy"]] or list(self.stats)
+            return min(healthy, key=lambda backend: self.stats[backend]["in_flight"]) if healthy else None
+
+    #Membership
+    def join(self, backend):
+        """Adds a backend and pulls over the sessions whose arcs it now owns"""
+        with self.lock:
+            if backend in self.stats:
+                return []
+        held = {old: _list_sessions(old) for old in self.backends()}
+        with self.lock:
+            self._add(backend)
+            moves = [(session_id, old, backend) for old, session_ids in held.items()
+                     for session_id in session_ids if self.ring.lookup(session_id) == backend]
+            self._pin(moves)
+        moved = self._handoff(moves)
+        print(f"[ROUTER] {backend} joined, {len(moved)}/{len(moves)} sessions handed over")
+        return moved
+
+    def drain(self, backend):
+        """Takes a backend off the ring and hands its sessions to their new owners"""
+        with self.lock:
+            if backend not in self.stats:
+                return None
+        session_ids = _list_sessions(backend)
+        with self.lock:
+            self.ring.remove(backend)
+            moves = [(session_id, backend, self.ring.lookup(session_id)) for session_id in session_ids]
+            moves = [move for move in moves if move[2] is not None]
+            self._pin(moves)
+        moved = self._handoff(moves)
+        with self.lock:
+            self.stats.pop(backend, None)
+        print(f"[ROUTER] {backend} drained, {len(moved)}/{len(moves)} sessions handed over")
+        return moved
+
+    def _pin(self, moves):
+        # Until its state has moved, a session keeps going to the replica that holds it
+        for session_id, source, _ in moves:
+            self.pinned[session_id] = source
+
+    def _handoff(self, moves):
+        moved = []
+        for session_id, source, target in moves:
+            with self.session_lock(session_id):
+                try:
+                    state = _admin_request(source, f"/admin/sessions/{session_id}")
+                    _admin_request(target, f"/admin/sessions/{session_id}", data=state, method='PUT')
+                    moved.append(session_id)
+                except (urllib.error.URLError, OSError) as e:
+                    print(f"[ROUTER] Handoff of {session_id} from {source} to {target} failed: {e}")
+                finally:
+                    with self.lock:
+                        self.pinned.pop(session_id, None)
+        return moved
+
+    def check_health(self):
+        for backend in self.backends():
+            try:
+                urllib.request.urlopen(f"{backend}/health", timeout=3).read()
+                healthy = True
+            except (urllib.error.URLError, OSError):
+                healthy = False
+            with self.lock:
+                stats = self.stats.get(backend)
+                if stats is None or stats["healthy"] == healthy:
+                    continue
+                stats["healthy"] = healthy
+                # A dead replica's sessions cannot be handed over; move its arcs so calls continue elsewhere
+                if healthy:
+                    self.ring.add(backend)
+                else:
+                    self.ring.remove(backend)
+            print(f"[ROUTER] {backend} is {'back' if healthy else 'DOWN'}")
+
+    def forget_idle_sessions(self):
+        cutoff = time.time() - SESSION_TTL
+        with self.lock:
+            for session_id in [key for key, seen in self.sessions.items() if seen < cutoff]:
+                del self.sessions[session_id]
+                self.session_locks.pop(session_id, None)
+
+    #Load reporting
+    def record(self, backend, started, failed):
+        with self.lock:
+            stats = self.stats.get(backend)
+            if stats is not None:
+                stats["in_flight"] -= 1
+                stats["requests"] += 1
+                stats["errors"] += int(failed)
+                stats["total_ms"] += (time.time() - started) * 1000
+
+    def report(self):
+        with self.lock:
+            shares = self.ring.shares()
+            sessions = {}
+            for session_id in self.sessions:
+                owner = self.ring.lookup(session_id)
+                sessions[owner] = sessions.get(owner, 0) + 1
+            return {backend: {
+                "healthy": stats["healthy"],
+                "ring_share": round(shares.get(backend, 0), 4),
+                "sessions": sessions.get(backend, 0),
+                "in_flight": stats["in_flight"],
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else None
+            } for backend, stats in self.stats.items()}
+
+
+def _admin_request(backend, path, data=None, method='GET'):
+    headers = {'Content-Type': 'application/octet-stream'}
+    if ADMIN_TOKEN:
+        headers['X-Admin-Token'] = ADMIN_TOKEN
+    req = urllib.request.Request(backend + path, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return response.read()
+
+
+def _list_sessions(backend):
+    try:
+        return json.loads(_admin_request(backend, '/admin/sessions'))["sessions"]
+    except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+        print(f"[ROUTER] Could not list sessions on {backend}: {e}")
+        return []
+
+
+#ROUTER APP
+app = Flask(__name__)
+router = None
+
+
+def _admin_allowed():
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+def _session_id():
+    """Session id from the X-Session-Id header, the query string or the form body"""
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    if not session_id and request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        request.get_data()  # Cache the raw body for forwarding before the form is parsed
+        session_id = request.form.get('session_id')
+    return session_id
+
+
+def _forward(backend, path, body):
+    """Sends the request to a backend; returns (status, headers, body iterator)"""
+    url = backend + path + (f"?{request.query_string.decode()}" if request.query_string else "")
+    headers = {name: request.headers[name] for name in FORWARD_HEADERS if name in request.headers}
+    headers['X-Forwarded-For'] = request.remote_addr or ''
+    req = urllib.request.Request(url, data=body if request.method not in ('GET', 'HEAD') else None,
+                                 headers=headers, method=request.method)
+    try:
+        response = urllib.request.urlopen(req, timeout=PROXY_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        response = e
+    # Stream the body through as it arrives so progressive /predict and SSE keep working
+    read = getattr(response, 'read1', response.read)
+    return response.status, response.headers.get('Content-Type'), iter(lambda: read(8192), b'')
+
+
+@app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE'])
+@app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
+def proxy(path):
+    # Replicas see the router as a local caller, so their admin endpoints
+    # (reload, session export/import, profiles) would be open to anyone who
+    # reaches the router. Admins call the replicas directly instead.
+    # Normalized and decoded, so '//admin', 'x/../admin' and 'admin%2F...' are caught too
+    if posixpath.normpath('/' + urllib.parse.unquote(path)).lstrip('/').split('/')[0] == 'admin':
+        return jsonify({'error': 'Admin endpoints are not proxied; call the replica directly'}), 403
+    session_id = _session_id()
+    body = request.get_data()
+    session_lock = router.session_lock(session_id) if session_id else None
+    if session_lock is not None:
+        session_lock.acquire()
+    try:
+        backend = router.owner(session_id) if session_id else router.least_loaded()
+        if backend is None:
+            return jsonify({'error': 'No backends available'}), 503
+        with router.lock:
+            router.stats[backend]["in_flight"] += 1
+        started = time.time()
+        try:
+            status, content_type, chunks = _forward(backend, '/' + path, body)
+        except (urllib.error.URLError, OSError) as e:
+            router.record(backend, started, failed=True)
+            return jsonify({'error': f"Backend {backend} unavailable: {e}"}), 502
+    finally:
+        if session_lock is not None:
+            session_lock.release()
+
+    def relay():
+        try:
+            yield from chunks
+        finally:
+            router.record(backend, started, failed=status >= 500)
+
+    response = Response(stream_with_context(relay()), status=status, content_type=content_type)
+    response.headers['X-Backend'] = backend
+    return response
+
+
+@app.route('/router/backends', methods=['GET', 'POST', 'DELETE'])
+def backends():
+    """GET lists backends; POST {"url"} joins one; DELETE ?url= drains one"""
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return jsonify({"backends": router.backends()})
+    if request.method == 'POST':
+        url = ((request.get_json(silent=True) or {}).get('url') or '').rstrip('/')
+        if not url:
+            return jsonify({'error': 'No backend url provided'}), 400
+        return jsonify({"joined": url, "sessions_moved": router.join(url)})
+    url = (request.args.get('url') or '').rstrip('/')
+    moved = router.drain(url)
+    if moved is None:
+        return jsonify({'error': f"Unknown backend '{url}'"}), 404
+    return jsonify({"drained": url, "sessions_moved": moved})
+
+
+@app.route('/router/stats', methods=['GET'])
+def stats():
+    """Per-shard load: ring share, live sessions, requests in flight, errors, latency"""
+    return jsonify({"backends": router.report(), "sessions": len(router.sessions)})
+
+
+def _maintenance_loop():
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL)
+        router.check_health()
+        router.forget_idle_sessions()
+
+
+def main():
+    global router
+    parser = argparse.ArgumentParser(description="Consistent-hash session router for app.py replicas")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--backend', action='append', default=[], help="Replica base URL (repeatable)")
+    parser.add_argument('--vnodes', type=int, default=VIRTUAL_NODES, help="Virtual nodes per replica")
+    args = parser.parse_args()
+
+    router = Router([backend.rstrip('/') for backend in args.backend], args.vnodes)
+    threading.Thread(target=_maintenance_loop, daemon=True, name='router-health').start()
+    print(f"[ROUTER] Routing to {len(args.backend)} backends on port {args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
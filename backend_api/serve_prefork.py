@@ -0,0 +1,135 @@
+"""Pre-fork server: load Whisper and the CNN-LSTM once, then fork HTTP workers.
+
+Each worker inherits the parent's model weights copy-on-write instead of
+loading its own copy, so adding a worker costs its private pages only.
+The parent keeps the listening socket, restarts workers that die (and
+supervises the inference pool's Whisper workers) and prints
+per-worker RSS/PSS so the saving can be checked (sum of PSS ~ real usage).
+
+/stream with a session_id is rejected here: sessions live in one process,
+and the workers share the socket, so a call's chunks would land in different
+workers. Run app.py replicas behind router.py for session streaming.
+
+Linux/macOS only (needs os.fork). Models are loaded but never run in the
+parent: running torch/TensorFlow before forking starts thread pools that do
+not survive fork.
+
+Usage:
+    python serve_prefork.py --workers 4 --port 5000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from memstats import memory_usage
+
+
+def _serve(sock, flask_app, threaded):
+    """Worker body: serve requests on the inherited socket until terminated"""
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, flask_app, threaded=threaded, fd=sock.fileno())
+    server.serve_forever()
+
+
+def _spawn(sock, flask_app, threaded):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _serve(sock, flask_app, threaded)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def report_memory(workers):
+    """Prints RSS/PSS for the parent and every worker"""
+    parent = memory_usage()
+    rows = [('parent', parent)] + [(f'worker {pid}', memory_usage(pid)) for pid in workers]
+    total_rss = sum(usage.get('rss_mb', 0) for _, usage in rows)
+    total_pss = sum(usage.get('pss_mb', 0) for _, usage in rows)
+    print("[PREFORK] Memory (MB):  " + " | ".join(
+        f"{name}: rss={usage.get('rss_mb', '?')} pss={usage.get('pss_mb', '?')}" for name, usage in rows))
+    print(f"[PREFORK] Total: rss={total_rss:.1f} MB (double counts shared pages), pss={total_pss:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve app.py from pre-forked workers sharing one model copy")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', action='store_true', help="Also use threads inside each worker")
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help="Seconds between memory reports (0 disables)")
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("ERROR: Pre-fork serving needs os.fork (Linux/macOS). Use 'python app.py' instead.")
+        return 1
+
+    # Tells app.py it is served by several processes (per-process watchers, reload fan-out)
+    os.environ['SERVE_PREFORK'] = '1'
+    # Importing app loads every model in this process
+    import app as scam_app
+
+    sock = socket.create_server((args.host, args.port), backlog=128)
+    sock.set_inheritable(True)
+
+    # Move everything loaded so far out of the GC's reach: collections would
+    # otherwise touch every object header and un-share the pages in each worker
+    gc.collect()
+    gc.freeze()
+
+    workers = {_spawn(sock, scam_app.app, args.threads) for _ in range(args.workers)}
+    print(f"[PREFORK] Serving on http://{args.host}:{args.port} with {len(workers)} workers: "
+          f"{', '.join(map(str, sorted(workers)))}")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    last_report = time.time()
+    while not stopping:
+        time.sleep(0.5)
+        # Replace workers that crashed
+        for pid in list(workers):
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished and not stopping:
+                workers.discard(pid)
+                print(f"[PREFORK] Worker {pid} exited (status {status}), restarting")
+                workers.add(_spawn(sock, scam_app.app, args.threads))
+        # Restart dead or stuck inference workers (only this process can)
+        if scam_app.inference_pool is not None:
+            scam_app.inference_pool.supervise()
+        if args.report_interval and time.time() - last_report >= args.report_interval:
+            report_memory(workers)
+            last_report = time.time()
+
+    print("[PREFORK] Shutting down workers...")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Batched Whisper decoding for concurrent /stream chunks.
+
+Each /stream chunk used to get its own stt_model.transcribe call, so 50
+concurrent calls meant 50 encoder passes over a 30-second mel, most of it
+padding. Request threads instead put their chunk's log-mel (computed in
+the request thread with mel_stream, or taken straight from the session's
+mel buffer) on a queue. A scheduler thread collects whatever arrives within
+max_wait seconds, up to max_batch chunks, stacks the mels and runs one
+whisper.decode over the batch: one encoder pass and one batched greedy decode.
+It then hands each transcript back to the request thread that is waiting for it.
+
+Chunks with different decoding options (language) go in separate batches.
+whisper.decode does not retry with higher temperatures like transcribe()
+does, which is fine for 5-second live chunks. Audio longer than 30 seconds
+still goes through transcribe().
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from mel_stream import MelStream
+from pipeline import SAMPLE_RATE, decoded_text
+
+MAX_SECONDS = 30  # Whisper's input window
+
+
+class _Request:
+    __slots__ = ('mel', 'language', 'queued_at', 'waited', 'text', 'error', 'done')
+
+    def __init__(self, mel, language):
+        self.mel = mel
+        self.language = language
+        self.queued_at = time.perf_counter()
+        self.waited = 0.0
+        self.text = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchedTranscriber:
+    """Collects chunks from concurrent requests and decodes them as one batch"""
+
+    def __init__(self, model, max_batch=16, max_wait=0.02, timeout=60):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.pending = queue.Queue()
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.chunks = 0
+        self.largest_batch = 0
+        self.queue_wait_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    def fits(self, audio):
+        return len(audio) <= MAX_SECONDS * SAMPLE_RATE
+
+    def transcribe(self, audio, language=None, timings=None):
+        """Transcribes up to 30 s of 16 kHz audio as part of the next batch"""
+        stream = MelStream(self.model.dims.n_mels)
+        stream.append(audio)
+        return self.transcribe_mel(stream.model_input(), language, timings)
+
+    def transcribe_mel(self, mel, language=None, timings=None):
+        """Transcribes a normalized (n_mels, 3000) log-mel as part of the next batch
+
+        With a timings dict, the time spent waiting for the batch is added to
+        timings["queue_seconds"].
+        """
+        self._ensure_thread()
+        request = _Request(np.ascontiguousarray(mel, dtype=np.float32), language)
+        self.pending.put(request)
+        if not request.done.wait(self.timeout):
+            raise TimeoutError(f"Batched transcription timed out after {self.timeout}s")
+        if timings is not None:
+            timings["queue_seconds"] = timings.get("queue_seconds", 0.0) + request.waited
+        if request.error:
+            raise RuntimeError(request.error)
+        return request.text
+
+    def _ensure_thread(self):
+        # Started lazily so each pre-forked worker runs its own scheduler
+        if self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name='stt-batcher')
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.pending.get(timeout=max(0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.language, []).append(request)
+            for language, group in groups.items():
+                self._decode(group, language)
+
+    def _decode(self, group, language):
+        import torch
+        import whisper
+        started = time.perf_counter()
+        try:
+            mel = torch.from_numpy(np.stack([request.mel for request in group])).to(self.model.device)
+            options = whisper.DecodingOptions(language=language, fp16=self.model.device.type == 'cuda')
+            results = whisper.decode(self.model, mel, options)
+            for request, result in zip(group, results):
+                # decode() has no silence gate of its own, unlike transcribe()
+                request.text = decoded_text(result)
+        except Exception as e:
+            for request in group:
+                request.error = f"Batched decode failed: {e}"
+        finally:
+            finished = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self.chunks += len(group)
+                self.largest_batch = max(self.largest_batch, len(group))
+                for request in group:
+                    request.waited = started - request.queued_at
+                self.queue_wait_seconds += sum(request.waited for request in group)
+                self.decode_seconds += finished - started
+            for request in group:
+                request.done.set()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "chunks": self.chunks,
+                "avg_batch_size": round(self.chunks / self.batches, 2) if self.batches else None,
+                "largest_batch": self.largest_batch,
+                "avg_queue_wait_ms": round(self.queue_wait_seconds * 1000 / self.chunks, 2) if self.chunks else None,
+                "avg_decode_ms_per_chunk": round(self.decode_seconds * 1000 / self.chunks, 2) if self.chunks else None,
+                "queued": self.pending.qsize()
+            }
@@ -0,0 +1,234 @@
+"""Distilled student text classifier: hashed n-grams and a linear (or tiny MLP) head.
+
+train_model.py trains it on the CNN-LSTM's soft labels over the corpus, so it
+learns to reproduce the teacher's scores rather than only the hard labels.
+Features are word unigrams/bigrams and character 3-4 grams of each word,
+hashed into N_FEATURES buckets with crc32. No vocabulary pickle is needed and
+any transcript length is scored in one pass. Inference is a few NumPy
+gathers and dot products, so a 5-second chunk costs microseconds instead of a
+TensorFlow call.
+
+Select it for serving with SCAM_DETECTOR=student (app.py, app_trained_model.py).
+
+Usage:
+    python student_model.py report    # agreement with the CNN-LSTM and latency on the corpus
+"""
+import json
+import re
+import sys
+import time
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+#CONFIGURATION
+N_FEATURES = 1 << 18
+CHAR_NGRAMS = (3, 4)
+STUDENT_PATH = 'student_model.npz'
+# Distillation: target = SOFT_LABEL_WEIGHT * teacher probability + rest * true label
+SOFT_LABEL_WEIGHT = 0.7
+DISTILL_TEMPERATURE = 2.0  # Softens the teacher's probabilities before fitting them
+
+_word_pattern = re.compile(r"[a-z0-9']+")
+
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode()) % N_FEATURES
+
+
+@lru_cache(maxsize=100000)
+def _word_features(word):
+    """Buckets of the word itself and its character n-grams (cached: words repeat a lot)"""
+    padded = f"<{word}>"
+    features = [_bucket("w:" + word)]
+    for n in CHAR_NGRAMS:
+        features.extend(_bucket("c:" + padded[i:i + n]) for i in range(len(padded) - n + 1))
+    return tuple(features)
+
+
+def featurize(text):
+    """Sparse L2-normalized feature vector of one text: (bucket indices, values)"""
+    words = _word_pattern.findall(text.lower())
+    buckets = [bucket for word in words for bucket in _word_features(word)]
+    buckets.extend(_bucket(f"b:{a} {b}") for a, b in zip(words, words[1:]))
+    if not buckets:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices, counts = np.unique(np.asarray(buckets, dtype=np.int64), return_counts=True)
+    values = np.log1p(counts).astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def featurize_batch(texts):
+    """Concatenated sparse rows: (row ids, bucket indices, values)"""
+    rows, indices, values = [], [], []
+    for row, text in enumerate(texts):
+        text_indices, text_values = featurize(text)
+        rows.append(np.full(len(text_indices), row, dtype=np.int64))
+        indices.append(text_indices)
+        values.append(text_values)
+    if not texts:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32)
+    return np.concatenate(rows), np.concatenate(indices), np.concatenate(values)
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-np.clip(x, -30, 30)))
+
+
+class StudentModel:
+    """Hashed n-gram classifier with the TextModel interface used by pipeline.analyze_texts"""
+
+    def __init__(self, weights, bias, hidden_weights=None, hidden_bias=None, version='student', report=None,
+                 temperature=DISTILL_TEMPERATURE):
+        self.weights = weights                # (N_FEATURES,) or, with a hidden layer, (hidden,)
+        self.bias = float(bias)
+        self.hidden_weights = hidden_weights  # (N_FEATURES, hidden) or None for a linear head
+        self.hidden_bias = hidden_bias
+        # The head was fitted to teacher logits / temperature, so serving scales them back
+        self.temperature = float(temperature)
+        self.version = version
+        self.report = report or {}
+        self.loaded_at = time.time()
+
+    def _logits(self, rows, indices, values, n_texts):
+        if self.hidden_weights is None:
+            logits = np.bincount(rows, weights=self.weights[indices] * values, minlength=n_texts) + self.bias
+        else:
+            hidden = np.zeros((n_texts, self.hidden_weights.shape[1]), dtype=np.float32)
+            np.add.at(hidden, rows, self.hidden_weights[indices] * values[:, None])
+            logits = np.maximum(hidden + self.hidden_bias, 0) @ self.weights + self.bias
+        return logits * self.temperature
+
+    def predict(self, texts):
+        """Returns the scam probability of each text"""
+        rows, indices, values = featurize_batch(texts)
+        return _sigmoid(self._logits(rows, indices, values, len(texts)))
+
+    def predict_windows(self, texts):
+        # The whole text is one feature vector, so there are no windows to report
+        return self.predict(texts), [None] * len(texts)
+
+    def save(self, path):
+        arrays = {"weights": self.weights, "bias": np.float32(self.bias),
+                  "temperature": np.float32(self.temperature), "report": np.array(json.dumps(self.report))}
+        if self.hidden_weights is not None:
+            arrays.update(hidden_weights=self.hidden_weights, hidden_bias=self.hidden_bias)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path, version=None):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["hidden_weights"] if "hidden_weights" in data else None,
+                       data["hidden_bias"] if "hidden_bias" in data else None,
+                       version=version or 'student', report=json.loads(str(data["report"])),
+                       temperature=data["temperature"] if "temperature" in data else DISTILL_TEMPERATURE)
+
+
+#TRAINING
+def distill_targets(teacher_probabilities, labels):
+    """Temperature-softened teacher probabilities mixed with the true labels"""
+    p = np.clip(np.asarray(teacher_probabilities, dtype=np.float64), 1e-6, 1 - 1e-6)
+    softened = _sigmoid(np.log(p / (1 - p)) / DISTILL_TEMPERATURE)
+    return SOFT_LABEL_WEIGHT * softened + (1 - SOFT_LABEL_WEIGHT) * np.asarray(labels, dtype=np.float64)
+
+
+def train(texts, targets, hidden=0, epochs=300, learning_rate=0.05, l2=1e-6, seed=0):
+    """Fits the student to (soft) targets in [0, 1] with full-batch Adam on cross-entropy.
+
+    The targets are softened by DISTILL_TEMPERATURE, so the returned model
+    multiplies its logits by it when predicting.
+    """
+    rng = np.random.default_rng(seed)
+    rows, indices, values = featurize_batch(texts)
+    targets = np.asarray(targets, dtype=np.float32)
+    n = len(texts)
+
+    params = {"bias": np.zeros(1, dtype=np.float32)}
+    if hidden:
+        params["hidden_weights"] = rng.normal(0, 0.1, (N_FEATURES, hidden)).astype(np.float32)
+        params["hidden_bias"] = np.zeros(hidden, dtype=np.float32)
+        params["weights"] = rng.normal(0, 0.1, hidden).astype(np.float32)
+    else:
+        params["weights"] = np.zeros(N_FEATURES, dtype=np.float32)
+    moments = {name: (np.zeros_like(p), np.zeros_like(p)) for name, p in params.items()}
+
+    for step in range(1, epochs + 1):
+        grads = {}
+        if hidden:
+            pre = np.zeros((n, hidden), dtype=np.float32)
+            np.add.at(pre, rows, params["hidden_weights"][indices] * values[:, None])
+            pre += params["hidden_bias"]
+            activation = np.maximum(pre, 0)
+            error = (_sigmoid(activation @ params["weights"] + params["bias"][0]) - targets) / n
+            grads["weights"] = activation.T @ error
+            delta = np.outer(error, params["weights"]) * (pre > 0)
+            grads["hidden_bias"] = delta.sum(axis=0)
+            grads["hidden_weights"] = np.zeros_like(params["hidden_weights"])
+            np.add.at(grads["hidden_weights"], indices, delta[rows] * values[:, None])
+            grads["hidden_weights"] += l2 * params["hidden_weights"]
+        else:
+            logits = np.bincount(rows, weights=params["weights"][indices] * values, minlength=n) + params["bias"][0]
+            error = (_sigmoid(logits) - targets) / n
+            grads["weights"] = np.bincount(indices, weights=error[rows] * values,
+                                           minlength=N_FEATURES).astype(np.float32)
+            grads["weights"] += l2 * params["weights"]
+        grads["bias"] = np.array([error.sum()], dtype=np.float32)
+
+        for name, grad in grads.items():
+            m, v = moments[name]
+            m *= 0.9
+            m += 0.1 * grad
+            v *= 0.999
+            v += 0.001 * grad * grad
+            params[name] -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+
+    return StudentModel(params["weights"], params["bias"][0],
+                        params.get("hidden_weights"), params.get("hidden_bias"))
+
+
+def compare(student, teacher_probabilities, texts, threshold, repeats=200):
+    """Agreement with the teacher and single-transcript latency of the student"""
+    student_probabilities = student.predict(texts)
+    teacher_probabilities = np.asarray(teacher_probabilities)
+    sample = texts[:repeats] or [""]
+    _word_features.cache_clear()  # Measure cold words too, not only cache hits
+    started = time.perf_counter()
+    for text in sample:
+        student.predict([text])
+    per_text = (time.perf_counter() - started) / len(sample)
+    return {
+        "agreement": round(float(np.mean((student_probabilities > threshold) == (teacher_probabilities > threshold))), 4),
+        "mean_abs_difference": round(float(np.mean(np.abs(student_probabilities - teacher_probabilities))), 4),
+        "student_latency_us": round(per_text * 1e6, 1),
+        "texts": len(texts),
+        "threshold": threshold
+    }
+
+
+def report():
+    """Re-scores the corpus with both detectors and prints agreement and latency"""
+    import csv
+    import pipeline
+    with open('call_transcript_cleaned.csv', newline='', encoding='utf-8') as handle:
+        texts = [row['TEXT'] for row in csv.DictReader(handle)]
+    student = StudentModel.load(STUDENT_PATH)
+    teacher = pipeline.build_text_model(warm_up=True)
+
+    started = time.perf_counter()
+    for text in texts[:50]:
+        teacher.predict([text])
+    teacher_latency = (time.perf_counter() - started) / min(len(texts), 50)
+
+    results = compare(student, teacher.predict(texts), texts, pipeline.SCAM_THRESHOLD)
+    results["teacher_latency_us"] = round(teacher_latency * 1e6, 1)
+    results["speedup"] = round(results["teacher_latency_us"] / results["student_latency_us"], 1)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['report']:
+        print(__doc__)
+        sys.exit(1)
+    sys.exit(report())
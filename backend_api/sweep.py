@@ -0,0 +1,248 @@
+"""Hyperparameter sweep and threshold calibration for the CNN-LSTM.
+
+Trains every candidate configuration (embedding dim, Conv1D filters, LSTM
+units, epochs) with stratified k-fold cross-validation, one (configuration,
+fold) job per process in a pool. The corpus is tokenized once and cached in
+sweep_cache.npz, keyed by the CSV's hash, so reruns and workers skip that
+step. Out-of-fold scores give a precision/recall curve per configuration,
+computed vectorized over every threshold at once. The best configuration's
+curve picks the threshold whose false-positive rate stays within the target.
+
+The result is written to scam_config.json with a version, and a copy is kept
+in configs/. pipeline.py (app.py, batch_score.py) and app_trained_model.py
+load the threshold at startup; train_model.py trains with the chosen
+hyperparameters.
+
+Usage:
+    python sweep.py --target-fpr 0.05 --folds 5 --workers 4
+    python sweep.py --embedding-dim 64 100 --filters 64 128 --lstm-units 32 64 --epochs 5 10
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+#CONFIGURATION
+DATASET = 'call_transcript_cleaned.csv'
+CACHE_PATH = 'sweep_cache.npz'
+CONFIG_PATH = 'scam_config.json'
+CONFIGS_DIR = 'configs'
+VOCAB_SIZE = 5000
+MAX_LENGTH = 100
+GRID = {
+    "embedding_dim": [64, 100],
+    "filters": [64, 128],
+    "lstm_units": [32, 64],
+    "epochs": [5, 10],
+}
+
+
+#CACHED TOKENIZED DATA
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_dataset(dataset=DATASET, cache_path=CACHE_PATH, verbose=True):
+    """Padded sequences and labels, tokenized once per version of the CSV"""
+    key = f"{_file_hash(dataset)}:{VOCAB_SIZE}:{MAX_LENGTH}"
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if str(cached["key"]) == key:
+                if verbose:
+                    print(f"[SWEEP] Using cached tokenized data ({cache_path})")
+                return cached["sequences"], cached["labels"], key
+
+    import pandas as pd
+    from tensorflow.keras.preprocessing.text import Tokenizer
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    print("[SWEEP] Tokenizing corpus...")
+    data = pd.read_csv(dataset)
+    texts = data['TEXT'].astype(str).tolist()
+    tokenizer = Tokenizer(num_words=VOCAB_SIZE, oov_token="<OOV>")
+    tokenizer.fit_on_texts(texts)
+    sequences = pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=MAX_LENGTH,
+                              padding='post', truncating='post').astype('int32')
+    labels = data['CATEGORY'].values.astype('int32')
+    np.savez(cache_path, sequences=sequences, labels=labels, key=np.array(key))
+    return sequences, labels, key
+
+
+def stratified_folds(labels, k, seed=0):
+    """k arrays of validation indices with the same scam/legit ratio"""
+    rng = np.random.default_rng(seed)
+    folds = [[] for _ in range(k)]
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        for fold, part in enumerate(np.array_split(indices, k)):
+            folds[fold].extend(part.tolist())
+    return [np.sort(np.asarray(fold)) for fold in folds]
+
+
+#WORKERS
+def _init_worker():
+    # Several trainings share the machine: one thread each avoids oversubscription
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def build_model(embedding_dim, filters, lstm_units):
+    """The train_model.py architecture with tunable sizes"""
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, LSTM, Conv1D, MaxPooling1D, Embedding, Dropout
+    model = Sequential([
+        Embedding(VOCAB_SIZE, embedding_dim),
+        Conv1D(filters=filters, kernel_size=5, activation='relu'),
+        MaxPooling1D(pool_size=2),
+        LSTM(lstm_units),
+        Dropout(0.2),
+        Dense(1, activation='sigmoid')
+    ])
+    model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    return model
+
+
+def train_fold(job):
+    """Worker task: trains one configuration on one fold; returns its validation scores"""
+    config, fold, validation, dataset, cache_path, seed = job
+    import tensorflow as tf
+    sequences, labels, _ = load_dataset(dataset, cache_path, verbose=False)
+    training = np.setdiff1d(np.arange(len(labels)), validation)
+    tf.keras.utils.set_random_seed(seed + fold)
+    model = build_model(config["embedding_dim"], config["filters"], config["lstm_units"])
+    started = time.time()
+    model.fit(sequences[training], labels[training], epochs=config["epochs"], verbose=0)
+    scores = model.predict(sequences[validation], verbose=0)[:, 0]
+    return config, fold, validation, scores, time.time() - started
+
+
+#METRICS (vectorized over all thresholds)
+def pr_curve(labels, scores):
+    """Precision, recall and false-positive rate at every distinct score threshold"""
+    order = np.argsort(-scores, kind='mergesort')
+    scores, labels = scores[order], labels[order]
+    # Last position of each run of equal scores: everything at or above that score is flagged
+    distinct = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    true_positives = np.cumsum(labels)[distinct]
+    false_positives = (distinct + 1) - true_positives
+    positives, negatives = labels.sum(), len(labels) - labels.sum()
+    return {
+        "thresholds": scores[distinct],
+        "precision": true_positives / (distinct + 1),
+        "recall": true_positives / max(positives, 1),
+        "fpr": false_positives / max(negatives, 1),
+    }
+
+
+def average_precision(curve):
+    recall_steps = np.diff(np.r_[0.0, curve["recall"]])
+    return float(np.sum(recall_steps * curve["precision"]))
+
+
+def threshold_for_fpr(curve, target_fpr):
+    """Lowest threshold (highest recall) whose false-positive rate is within the target"""
+    allowed = np.flatnonzero(curve["fpr"] <= target_fpr)
+    if len(allowed) == 0:
+        return None
+    best = allowed[-1]
+    return {
+        # Just below the score, so pipeline's `prediction > threshold` still flags it
+        "threshold": float(np.nextafter(curve["thresholds"][best], 0)),
+        "precision": round(float(curve["precision"][best]), 4),
+        "recall": round(float(curve["recall"][best]), 4),
+        "fpr": round(float(curve["fpr"][best]), 4),
+    }
+
+
+def run(args):
+    sequences, labels, cache_key = load_dataset(args.dataset, args.cache)
+    folds = stratified_folds(labels, args.folds, args.seed)
+    grid = {"embedding_dim": args.embedding_dim, "filters": args.filters,
+            "lstm_units": args.lstm_units, "epochs": args.epochs}
+    configs = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    jobs = [(config, fold, validation, args.dataset, args.cache, args.seed)
+            for config in configs for fold, validation in enumerate(folds)]
+    print(f"[SWEEP] {len(configs)} configurations x {args.folds} folds = {len(jobs)} trainings "
+          f"on {args.workers} workers")
+
+    out_of_fold = {}
+    started = time.time()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.workers, initializer=_init_worker) as pool:
+        for done, (config, fold, validation, scores, seconds) in enumerate(
+                pool.imap_unordered(train_fold, jobs), 1):
+            key = json.dumps(config, sort_keys=True)
+            out_of_fold.setdefault(key, np.full(len(labels), np.nan))[validation] = scores
+            print(f"[SWEEP] {done}/{len(jobs)} {key} fold {fold}: {seconds:.1f}s")
+
+    results = []
+    for key, scores in out_of_fold.items():
+        curve = pr_curve(labels, scores)
+        results.append({
+            "hyperparameters": json.loads(key),
+            "average_precision": round(average_precision(curve), 4),
+            "accuracy_at_0.5": round(float(np.mean((scores > 0.5) == labels)), 4),
+            "operating_point": threshold_for_fpr(curve, args.target_fpr),
+        })
+    results.sort(key=lambda result: -result["average_precision"])
+    best = results[0]
+    if best["operating_point"] is None:
+        print(f"ERROR: No threshold reaches a false-positive rate of {args.target_fpr}")
+        return 1
+
+    version = time.strftime('%Y%m%d-%H%M%S')
+    config = {
+        "version": version,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "dataset": {"path": args.dataset, "cache_key": cache_key, "rows": int(len(labels)),
+                    "scams": int(labels.sum())},
+        "target_fpr": args.target_fpr,
+        "scam_threshold": best["operating_point"]["threshold"],
+        "expected": best["operating_point"],
+        "hyperparameters": best["hyperparameters"],
+        "cross_validation": {"folds": args.folds, "seed": args.seed,
+                             "average_precision": best["average_precision"]},
+        "sweep": results,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(config, handle, indent=2)
+    os.makedirs(CONFIGS_DIR, exist_ok=True)
+    shutil.copy(args.output, os.path.join(CONFIGS_DIR, f"scam_config-{version}.json"))
+
+    point = best["operating_point"]
+    print(f"\n[SWEEP] Done in {time.time() - started:.0f}s. Best: {best['hyperparameters']} "
+          f"(average precision {best['average_precision']})")
+    print(f"[SWEEP] Threshold {config['scam_threshold']:.4f} at FPR <= {args.target_fpr}: "
+          f"precision {point['precision']}, recall {point['recall']}, FPR {point['fpr']}")
+    print(f"[SWEEP] Saved '{args.output}' (version {version}); restart the servers to apply it")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="k-fold hyperparameter sweep and threshold calibration")
+    parser.add_argument('--dataset', default=DATASET)
+    parser.add_argument('--cache', default=CACHE_PATH)
+    parser.add_argument('-o', '--output', default=CONFIG_PATH)
+    parser.add_argument('--target-fpr', type=float, default=0.05, help="Highest acceptable false-positive rate")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    for name, values in GRID.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, nargs='+', default=values)
+    return run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
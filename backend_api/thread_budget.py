@@ -0,0 +1,287 @@
+"""CPU thread budget for torch, TensorFlow, BLAS and the request handlers.
+
+By default Whisper (torch) and the Keras model (TensorFlow) each size their
+intra- and inter-op pools to every core, and so do OpenMP/BLAS. Flask serves
+each request on its own thread on top of that, so N concurrent requests run
+N x cores compute threads and throughput drops. A budget fixes the split once
+at start-up:
+
+    intra_op_threads         threads per request in torch, TensorFlow and BLAS
+    inter_op_threads         torch/TensorFlow inter-op pool size
+    max_concurrent_requests  /predict, /stream and /detect running at once; the
+                             rest wait (up to queue_timeout) then get a 503
+    inference_workers        default for INFERENCE_WORKERS (inference_pool.py)
+    pin_workers              give each inference worker its own set of cores
+
+The budget comes from thread_budget.json (written by `calibrate`) and can be
+overridden with environment variables (INTRA_OP_THREADS, INTER_OP_THREADS,
+MAX_CONCURRENT_REQUESTS, PIN_WORKERS). apply() must run before numpy, torch or
+TensorFlow are imported: the thread counts are read when they initialize.
+Without a file or overrides nothing changes. Limits are per process, so with
+serve_prefork.py each worker gets max_concurrent_requests.
+
+Usage:
+    python thread_budget.py calibrate   # try splits on the bundled test audio -> thread_budget.json
+    python thread_budget.py show        # print the budget app.py would apply
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+#CONFIGURATION
+BUDGET_PATH = os.environ.get('THREAD_BUDGET', 'thread_budget.json')
+QUEUE_TIMEOUT = 30  # Seconds a request waits for a free slot before a 503
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+OVERRIDES = {
+    "intra_op_threads": ('INTRA_OP_THREADS', int),
+    "inter_op_threads": ('INTER_OP_THREADS', int),
+    "max_concurrent_requests": ('MAX_CONCURRENT_REQUESTS', int),
+    "pin_workers": ('PIN_WORKERS', lambda value: value.lower() in ('1', 'true', 'yes')),
+}
+HERE = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(HERE, '..', 'mobile_app', 'assets', 'audio')
+
+budget = {}  # What apply() set up (empty: library defaults)
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def load(path=BUDGET_PATH):
+    """The budget from the JSON file (if any) with environment overrides"""
+    loaded = {}
+    if path and os.path.exists(path):
+        with open(path) as handle:
+            loaded = json.load(handle)
+    for key, (env_var, parse) in OVERRIDES.items():
+        if os.environ.get(env_var):
+            loaded[key] = parse(os.environ[env_var])
+    return loaded
+
+
+def apply(settings=None):
+    """Sets the thread environment for this process; call before importing numpy/torch/TF"""
+    global budget
+    settings = load() if settings is None else settings
+    if not settings:
+        return budget
+    intra = settings.get("intra_op_threads")
+    inter = settings.get("inter_op_threads") or 1
+    if intra:
+        # Explicitly exported variables win over the budget
+        for env_var in THREAD_ENV_VARS:
+            os.environ.setdefault(env_var, str(intra))
+        os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(intra))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', str(inter))
+    budget = dict(settings, inter_op_threads=inter)
+    print(f"[THREADS] Budget: {intra or 'default'} intra-op / {inter} inter-op threads, "
+          f"{settings.get('max_concurrent_requests') or 'unlimited'} concurrent requests")
+    return budget
+
+
+def configure_torch(threads=None):
+    """Applies the budget to torch (call after torch is imported; no-op without a budget)"""
+    threads = threads or budget.get("intra_op_threads")
+    if not threads or 'torch' not in sys.modules:
+        return
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(budget.get("inter_op_threads", 1))
+    except RuntimeError:
+        pass  # Already fixed once parallel work has started (e.g. in a forked worker)
+
+
+def core_sets(n):
+    """Splits the available cores into n contiguous, disjoint sets (shared if n > cores)"""
+    cores = available_cores()
+    if n >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(n)]
+    size, extra = divmod(len(cores), n)
+    sets, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+
+def pin_worker(index, workers):
+    """Pins the calling process to its core set; returns the number of cores (None if not possible)"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = core_sets(workers)[index]
+    os.sched_setaffinity(0, cores)
+    print(f"[THREADS] Inference worker {index} pinned to cores {cores}")
+    return len(cores)
+
+
+class RequestLimiter:
+    """Caps how many expensive requests run at once; the rest queue on a semaphore"""
+
+    def __init__(self, limit, queue_timeout=QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self):
+        with self.lock:
+            self.waiting += 1
+        acquired = self.semaphore.acquire(timeout=self.queue_timeout)
+        with self.lock:
+            self.waiting -= 1
+            if acquired:
+                self.active += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+        self.semaphore.release()
+
+    def stats(self):
+        with self.lock:
+            return {"limit": self.limit, "active": self.active, "waiting": self.waiting,
+                    "rejected": self.rejected}
+
+
+def stats():
+    return {key: budget.get(key) for key in
+            ("intra_op_threads", "inter_op_threads", "max_concurrent_requests",
+             "inference_workers", "pin_workers", "calibrated_at")} if budget else None
+
+
+#CALIBRATION
+def candidates(n_cores):
+    """Splits to try: threads per request x concurrent requests ~ cores, in threads and in pinned workers"""
+    threads = sorted({1, n_cores} | {2 ** i for i in range(1, n_cores.bit_length()) if 2 ** i < n_cores})
+    splits = []
+    for intra in threads:
+        concurrency = max(1, n_cores // intra)
+        splits.append({"intra_op_threads": intra, "inter_op_threads": 1,
+                       "max_concurrent_requests": concurrency, "inference_workers": 0, "pin_workers": False})
+        if concurrency > 1:
+            splits.append({"intra_op_threads": intra, "inter_op_threads": 1,
+                           "max_concurrent_requests": concurrency, "inference_workers": concurrency,
+                           "pin_workers": True})
+    return splits
+
+
+def measure(settings, rounds):
+    """Child process body: applies one split and times concurrent transcribe + score over the test audio"""
+    import glob
+    from concurrent.futures import ThreadPoolExecutor
+    apply(settings)
+    import numpy as np
+    import pipeline
+    pipeline.load_stt_model()
+    configure_torch()
+    pipeline.load_text_model()
+    clips = [pipeline.load_audio(path) for path in sorted(glob.glob(os.path.join(AUDIO_DIR, '*.wav')))]
+    if not clips:
+        raise SystemExit(f"No test audio in {AUDIO_DIR}")
+
+    transcribe = pipeline.transcribe
+    if settings["inference_workers"]:
+        from inference_pool import InferencePool
+        pool = InferencePool(workers=settings["inference_workers"],
+                             slots=2 * settings["inference_workers"],
+                             slot_seconds=max(len(clip) for clip in clips) / pipeline.SAMPLE_RATE + 1)
+        transcribe = pool.transcribe
+
+    def job(clip):
+        started = time.perf_counter()
+        pipeline.analyze_text(transcribe(clip))
+        return time.perf_counter() - started
+
+    job(clips[0])  # Warm-up
+    work = clips * rounds * settings["max_concurrent_requests"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(settings["max_concurrent_requests"]) as executor:
+        latencies = list(executor.map(job, work))
+    elapsed = time.perf_counter() - started
+    audio_seconds = sum(len(clip) for clip in work) / pipeline.SAMPLE_RATE
+    return {"throughput": round(audio_seconds / elapsed, 3),  # Audio seconds processed per second
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1),
+            "requests": len(work)}
+
+
+def calibrate(rounds=2, max_p95_ms=None, output=BUDGET_PATH):
+    """Runs every candidate split in a fresh process and saves the fastest one"""
+    n_cores = len(available_cores())
+    env = {key: value for key, value in os.environ.items()
+           if key not in THREAD_ENV_VARS and not key.startswith('TF_NUM_')
+           and key not in [env_var for env_var, _ in OVERRIDES.values()]}
+    env['THREAD_BUDGET'] = ''  # Children take only the split under test
+    results = []
+    for settings in candidates(n_cores):
+        label = (f"{settings['intra_op_threads']} threads x {settings['max_concurrent_requests']} "
+                 + ("pinned workers" if settings["inference_workers"] else "request threads"))
+        print(f"[CALIBRATE] {label}...")
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '_measure', json.dumps(settings),
+                                  str(rounds)], env=env, capture_output=True, text=True)
+        lines = [line for line in process.stdout.splitlines() if line.startswith('{')]
+        if process.returncode != 0 or not lines:
+            print(f"[CALIBRATE]   failed: {process.stderr.strip().splitlines()[-1:] or process.returncode}")
+            continue
+        result = dict(settings, **json.loads(lines[-1]))
+        print(f"[CALIBRATE]   {result['throughput']} audio s/s, p95 {result['p95_ms']} ms")
+        results.append(result)
+
+    eligible = [result for result in results if max_p95_ms is None or result["p95_ms"] <= max_p95_ms]
+    if not eligible:
+        print("ERROR: No split finished" + (f" within p95 {max_p95_ms} ms" if results else ""))
+        return 1
+    best = max(eligible, key=lambda result: result["throughput"])
+    chosen = {key: best[key] for key in ("intra_op_threads", "inter_op_threads", "max_concurrent_requests",
+                                         "inference_workers", "pin_workers")}
+    chosen.update(cores=n_cores, calibrated_at=time.strftime('%Y-%m-%dT%H:%M:%S'), results=results)
+    with open(output, 'w') as handle:
+        json.dump(chosen, handle, indent=2)
+    print(f"[CALIBRATE] Best: {best['intra_op_threads']} threads x {best['max_concurrent_requests']} "
+          f"({'pinned workers' if best['inference_workers'] else 'request threads'}), "
+          f"{best['throughput']} audio s/s. Saved '{output}'; restart app.py to apply it")
+    return 0
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Thread budget for torch/TensorFlow/BLAS and request handlers")
+    commands = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = commands.add_parser('calibrate', help="Find the best split on this machine")
+    calibrate_parser.add_argument('--rounds', type=int, default=2, help="Passes over the test audio per request thread")
+    calibrate_parser.add_argument('--max-p95-ms', type=float, help="Only accept splits with this p95 latency or less")
+    calibrate_parser.add_argument('-o', '--output', default=BUDGET_PATH or 'thread_budget.json')
+    commands.add_parser('show', help="Print the budget app.py would apply")
+    measure_parser = commands.add_parser('_measure')  # Internal: one calibration run
+    measure_parser.add_argument('settings')
+    measure_parser.add_argument('rounds', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        return calibrate(args.rounds, args.max_p95_ms, args.output)
+    if args.command == 'show':
+        print(json.dumps({key: value for key, value in load().items() if key != 'results'}, indent=2))
+        return 0
+    # Through the importable module, so pipeline and inference_pool see the same budget
+    import thread_budget
+    print(json.dumps(thread_budget.measure(json.loads(args.settings), args.rounds)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
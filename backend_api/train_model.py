@@ -6,11 +6,31 @@ from tensorflow.keras.layers import Dense, LSTM, Conv1D, MaxPooling1D, Embedding
 from tensorflow.keras.preprocessing.text import Tokenizer
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 import pickle
+import json
+import os
+import shutil
+import time
+import student_model
+import numpy_engine
+from pipeline import SCAM_THRESHOLD, MODELS_DIR, MODEL_READY_MARKER, load_config
 
 #CONFIGURATION
 VOCAB_SIZE = 5000   # Max unique words to learn
 MAX_LENGTH = 100    # Max length of a sentence
 EMBEDDING_DIM = 100 
+CONV_FILTERS = 128
+LSTM_UNITS = 64
+EPOCHS = 10
+
+# Use the best hyperparameters found by sweep.py, if it has been run
+scam_config = load_config()
+if scam_config is not None and scam_config.get('hyperparameters'):
+    hyperparameters = scam_config['hyperparameters']
+    EMBEDDING_DIM = hyperparameters.get('embedding_dim', EMBEDDING_DIM)
+    CONV_FILTERS = hyperparameters.get('filters', CONV_FILTERS)
+    LSTM_UNITS = hyperparameters.get('lstm_units', LSTM_UNITS)
+    EPOCHS = hyperparameters.get('epochs', EPOCHS)
+    print(f"Using hyperparameters from scam_config.json version {scam_config.get('version')}: {hyperparameters}")
 
 print("1. Loading Data from CSV...")
 
@@ -39,22 +59,17 @@ tokenizer.fit_on_texts(texts)
 sequences = tokenizer.texts_to_sequences(texts)
 padded_sequences = pad_sequences(sequences, maxlen=MAX_LENGTH, padding='post', truncating='post')
 
-# Save the Tokenizer (Critical for app.py to understand new words)
-with open('tokenizer.pickle', 'wb') as handle:
-    pickle.dump(tokenizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
-print("   Tokenizer saved.")
-
 #BUILD CNN-LSTM MODEL
 print("3. Building AI Model...")
 model = Sequential([
     Embedding(VOCAB_SIZE, EMBEDDING_DIM, input_length=MAX_LENGTH),
     
     # CNN Layer (Finds keywords like 'password', 'urgent')
-    Conv1D(filters=128, kernel_size=5, activation='relu'),
+    Conv1D(filters=CONV_FILTERS, kernel_size=5, activation='relu'),
     MaxPooling1D(pool_size=2),
     
     # LSTM Layer (Understands context/sentences)
-    LSTM(64),
+    LSTM(LSTM_UNITS),
     Dropout(0.2), # Helps prevent overfitting since dataset is small
     
     # Output Layer
@@ -65,10 +80,63 @@ model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy']
 
 #TRAIN MODEL
 print("4. Training Model (this might take 10-20 seconds)...")
-# Using epochs=10 because the dataset is small (358 rows)
-model.fit(padded_sequences, labels, epochs=10, verbose=1)
+# Using epochs=10 by default because the dataset is small (358 rows)
+model.fit(padded_sequences, labels, epochs=EPOCHS, verbose=1)
+
+#DISTILL STUDENT MODEL
+print("5. Distilling the fast student model (hashed n-grams, NumPy only)...")
+teacher_probabilities = model.predict(padded_sequences, verbose=0)[:, 0]
+targets = student_model.distill_targets(teacher_probabilities, labels)
+
+# Agreement is measured on transcripts the student did not see; the saved
+# student is then refitted on the whole corpus
+order = np.random.default_rng(0).permutation(len(texts))
+held_out, fit_on = order[:len(texts) // 5], order[len(texts) // 5:]
+student = student_model.train([texts[i] for i in fit_on], targets[fit_on])
+report = student_model.compare(student, teacher_probabilities[held_out], [texts[i] for i in held_out], SCAM_THRESHOLD)
+
+started = time.perf_counter()
+for i in held_out[:20]:
+    model.predict(padded_sequences[i:i + 1], verbose=0)
+report["teacher_latency_us"] = round((time.perf_counter() - started) / min(len(held_out), 20) * 1e6, 1)
+report["speedup"] = round(report["teacher_latency_us"] / report["student_latency_us"], 1)
+
+student = student_model.train(texts, targets)
+student.report = report
+print(f"   Agreement with CNN-LSTM on held-out calls: {report['agreement']:.1%} "
+      f"(mean |p diff| {report['mean_abs_difference']})")
+print(f"   Latency per transcript: student {report['student_latency_us']} us, "
+      f"CNN-LSTM {report['teacher_latency_us']} us ({report['speedup']}x faster)")
+
+#SAVE MODELS
+# Everything is written only now, after training, so a running server never
+# sees a new tokenizer next to the old model: first a complete versioned copy,
+# then the top-level files swapped in with os.replace, then MODEL_READY_MARKER
+# (what app.py's MODEL_WATCH_INTERVAL watcher reloads on).
+version = time.strftime('%Y%m%d-%H%M%S')
+version_dir = os.path.join(MODELS_DIR, version)
+staging_dir = version_dir + '.tmp'
+os.makedirs(staging_dir, exist_ok=True)
+model.save(os.path.join(staging_dir, 'scam_detector_model.h5'))
+# The Tokenizer is critical for app.py to understand new words
+with open(os.path.join(staging_dir, 'tokenizer.pickle'), 'wb') as handle:
+    pickle.dump(tokenizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
+# Same model for the TensorFlow-free server (SCAM_DETECTOR=numpy)
+numpy_engine.export_model(model, tokenizer, os.path.join(staging_dir, numpy_engine.WEIGHTS_PATH),
+                          os.path.join(staging_dir, numpy_engine.TOKENIZER_JSON_PATH))
+student.save(os.path.join(staging_dir, student_model.STUDENT_PATH))
+os.replace(staging_dir, version_dir)
+print(f"   Versioned copy saved in '{version_dir}'")
+
+for name in ('scam_detector_model.h5', 'tokenizer.pickle', numpy_engine.WEIGHTS_PATH,
+             numpy_engine.TOKENIZER_JSON_PATH, student_model.STUDENT_PATH):
+    shutil.copy(os.path.join(version_dir, name), name + '.tmp')
+    os.replace(name + '.tmp', name)
+with open(MODEL_READY_MARKER + '.tmp', 'w') as handle:
+    json.dump({"version": version, "saved_at": time.time()}, handle)
+os.replace(MODEL_READY_MARKER + '.tmp', MODEL_READY_MARKER)
 
-#SAVE MODEL
-model.save('scam_detector_model.h5')
 print("\n✅ SUCCESS: Model saved as 'scam_detector_model.h5'")
-print("   You can now restart app.py to use this new brain!")
\ No newline at end of file
+print(f"   NumPy engine export saved as '{numpy_engine.WEIGHTS_PATH}' + '{numpy_engine.TOKENIZER_JSON_PATH}'")
+print(f"   Student saved as '{student_model.STUDENT_PATH}' (serve it with SCAM_DETECTOR=student)")
+print("   A running app.py picks up the new brain via POST /admin/reload (or MODEL_WATCH_INTERVAL).")